@@ -0,0 +1,202 @@
+"""End to end conversion benchmark of RoadmapPDFConverter on a synthetic corpus (see benchmarks/synthetic.py).
+
+Three measurements are taken, each in a fresh process so that peak RSS is that of the measurement alone:
+
+    serial  every pdf converted in turn through RoadmapPDFConverter._parse
+    pool    the pdfs converted across a process pool through RoadmapPDFConverter._mp_parse
+    stages  every pdf converted one stage at a time (layout, filter, preprocess, merge, json dump) so the time
+            of each stage can be reported, in the streaming paths the stages are interleaved page by page
+
+The layout cache is disabled throughout. The serial and pool paths are checked to produce the same chunks. Results
+are printed and, with --output, written as json so they can be compared across changes.
+
+To run (from src/): python3 -m benchmarks.conversion --pages 40 40 40 40 --output conversion.json
+"""
+
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import platform
+import sys
+import tempfile
+from datetime import datetime, timezone
+from itertools import chain
+from multiprocessing import Pool, Process, Queue
+from time import perf_counter
+
+from benchmarks.synthetic import generate_corpus
+from converter import NUM_CPU, LineFilter, RoadmapPDFConverter
+from utils.extractors import count_pages, get_extractor
+
+try:
+    import resource
+except ImportError:
+    # not available on windows, peak RSS is then not reported
+    resource = None
+
+# mirrors the aeo category config, so the filter stage has exclusions to match
+BENCHMARK_CONFIG = {
+    "perdoc_config": False,
+    "exclusions_exact": ["U.S. Energy Information Administration\n", r"Source: .*", r"\d+\n"],
+    "exclusions_page": [0],
+    "inclusions_font": [10, 11, 14],
+    "table_of_contents": [1],
+    "laparams": {},
+    "to_filter": True,
+}
+STAGES = ("layout", "filter", "preprocess", "merge", "json_dump")
+
+
+def make_converter(dir_path):
+    converter = RoadmapPDFConverter(**BENCHMARK_CONFIG)
+    converter.config = BENCHMARK_CONFIG
+    converter.dir_path = dir_path
+    converter.use_layout_cache = False
+    return converter
+
+
+def peak_rss_mb(children=False):
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return usage / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def doc_digest(docs):
+    """Hash of the chunks of the converted documents, used to check the conversion paths agree.
+    """
+    digest = hashlib.sha256()
+    for doc in docs:
+        digest.update(json.dumps([chunk.to_dict() for chunk in doc["doc"]]).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def run_serial(dir_path):
+    converter = make_converter(dir_path)
+    docs = []
+    start = perf_counter()
+    for path in converter._get_pdf_and_config_paths():
+        converter._init_doc_config(**path)
+        docs.append(converter._parse(path["filename"]))
+    return {"seconds": perf_counter() - start, "digest": doc_digest(docs)}
+
+
+def _mp_parse_task(args):
+    converter, config = args
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        return converter._mp_parse(**config)
+
+
+def run_pool(dir_path, processes):
+    converter = make_converter(dir_path)
+    start = perf_counter()
+    tasks = [(converter, converter._get_doc_config(converter.config, converter.perdoc_config, **path))
+             for path in converter._get_pdf_and_config_paths()]
+    pool = Pool(processes=processes)
+    docs = pool.map(_mp_parse_task, tasks)
+    pool.close()
+    pool.join()
+    return {"seconds": perf_counter() - start, "digest": doc_digest(docs)}
+
+
+def run_stages(dir_path):
+    converter = make_converter(dir_path)
+    seconds = dict.fromkeys(STAGES, 0.0)
+    for path in converter._get_pdf_and_config_paths():
+        config = converter._get_doc_config(converter.config, converter.perdoc_config, **path)
+
+        start = perf_counter()
+        pages = list(get_extractor(config["extractor"]).iter_pages(config["filename"], config["laparams"]))
+        seconds["layout"] += perf_counter() - start
+
+        start = perf_counter()
+        line_filter = LineFilter(config["exclusions_exact"], config["exclusions_page"], config["inclusions_font"])
+        pages = [line_filter.filter(lines) for lines in pages]
+        seconds["filter"] += perf_counter() - start
+
+        start = perf_counter()
+        toc = []
+        chunks = list(converter._iter_chunks(chain.from_iterable(pages), config["table_of_contents"], toc))
+        seconds["preprocess"] += perf_counter() - start
+
+        start = perf_counter()
+        merged = list(converter._iter_merged_chunks(chunks))
+        seconds["merge"] += perf_counter() - start
+
+        start = perf_counter()
+        converter._dump_structured_json(os.path.join(dir_path, os.path.basename(config["output_path"])), merged, toc)
+        seconds["json_dump"] += perf_counter() - start
+    return {"seconds": sum(seconds.values()), "stages": seconds}
+
+
+def _measure(queue, fn, args):
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        result = fn(*args)
+    result["peak_rss_mb"] = peak_rss_mb()
+    children_rss = peak_rss_mb(children=True)
+    if children_rss:
+        result["peak_child_rss_mb"] = children_rss
+    queue.put(result)
+
+
+def measure(fn, *args):
+    """Runs fn(*args) in a fresh process and adds the peak RSS of that process (and of its pool workers, if any)
+    to the result.
+    """
+    queue = Queue()
+    process = Process(target=_measure, args=(queue, fn, args))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[40, 40, 40, 40], help="page count of each synthetic pdf")
+    parser.add_argument("--columns", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--processes", type=int, default=NUM_CPU // 2 if NUM_CPU != 1 else 1)
+    parser.add_argument("--repeat", type=int, default=1, help="runs of each measurement, the fastest is reported")
+    parser.add_argument("--output", help="write the results to this json file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as dir_path:
+        paths = generate_corpus(dir_path, args.pages, args.seed, args.columns)
+        n_pages = sum(count_pages(path) for path in paths)
+        runs = {
+            "serial": (run_serial, dir_path),
+            "pool": (run_pool, dir_path, args.processes),
+            "stages": (run_stages, dir_path),
+        }
+        results = {}
+        for name, (fn, *fn_args) in runs.items():
+            results[name] = min((measure(fn, *fn_args) for _ in range(args.repeat)), key=lambda r: r["seconds"])
+            results[name]["pages_per_sec"] = n_pages / results[name]["seconds"]
+
+    assert results["serial"]["digest"] == results["pool"]["digest"], "serial and pool conversion differ"
+    report = {
+        "benchmark": "conversion",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "processes": args.processes,
+        "corpus": {"pages": args.pages, "columns": args.columns, "seed": args.seed, "total_pages": n_pages},
+        "results": results,
+    }
+    for name, result in results.items():
+        rss = f", peak RSS {result['peak_rss_mb']:.1f} MB" if result["peak_rss_mb"] is not None else ""
+        print(f"{name}: {result['seconds']:.2f}s, {result['pages_per_sec']:.1f} pages/s{rss}")
+    for stage, seconds in results["stages"]["stages"].items():
+        print(f"    {stage}: {seconds:.3f}s ({100 * seconds / results['stages']['seconds']:.1f}%)")
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(report, fp, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Parity harness for the layout backends in utils/extractors.py.
+
+Every pdf of the EIA categories is converted with each backend into a temporary directory, bypassing the layout
+cache so that layout is actually timed. The _structured.json of each backend is then diffed against the one of the
+reference backend (the first given). Per document and per backend the harness reports pages/second and whether the
+output matches, and if not the share of chunks that do. A category should only be switched to another backend (the
+"extractor" item of its config) where the outputs match.
+
+To run (from src/): python3 -m benchmarks.extractor_parity --extractors pdfminer pymupdf --output parity.json
+"""
+
+import argparse
+import difflib
+import json
+import os
+import tempfile
+from time import perf_counter
+
+from converter import EIAAEOConverter, EIAIEOConverter
+from utils.extractors import EXTRACTORS, count_pages
+
+CONVERTERS = {"aeo": EIAAEOConverter, "ieo": EIAIEOConverter}
+
+
+def chunk_match_ratio(reference, other):
+    """Share of chunks (font size and text) the two structured documents have in common, in order.
+    """
+    a = [(c.get('size'), c.get('text')) for c in reference['doc']]
+    b = [(c.get('size'), c.get('text')) for c in other['doc']]
+    return difflib.SequenceMatcher(None, a, b, autojunk=False).ratio()
+
+
+def run_category(category, extractors, out_dir):
+    converter = CONVERTERS[category]()
+    converter.use_layout_cache = False
+    base_config = converter.config
+    results = []
+    for path in converter._get_pdf_and_config_paths():
+        n_pages = count_pages(path['filename'])
+        fn = os.path.basename(path['filename'])
+        outputs = {}
+        doc_result = {"category": category, "filename": fn, "pages": n_pages, "extractors": {}}
+        for name in extractors:
+            converter.config = {**base_config, "extractor": name}
+            outfile = os.path.join(out_dir, f"{category}_{name}_{fn}.json")
+            start = perf_counter()
+            converter._mp_parse_pdf_to_json(**{**path, "outfile": outfile})
+            elapsed = perf_counter() - start
+            with open(outfile, "r") as fp:
+                outputs[name] = json.load(fp)
+            doc_result["extractors"][name] = {"seconds": elapsed, "pages_per_sec": n_pages / elapsed}
+        reference = outputs[extractors[0]]
+        for name in extractors:
+            doc_result["extractors"][name]["matches"] = outputs[name] == reference
+            doc_result["extractors"][name]["chunk_match_ratio"] = chunk_match_ratio(reference, outputs[name])
+        results.append(doc_result)
+        summary = ", ".join(f"{name} {r['pages_per_sec']:.1f} pages/s {'match' if r['matches'] else 'DIFF %.2f' % r['chunk_match_ratio']}"
+                            for name, r in doc_result["extractors"].items())
+        print(f"{category}/{fn} ({n_pages} pages): {summary}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--extractors", nargs="+", default=list(EXTRACTORS), choices=list(EXTRACTORS),
+                        help="backends to compare, the first is the reference")
+    parser.add_argument("--categories", nargs="+", default=list(CONVERTERS), choices=list(CONVERTERS))
+    parser.add_argument("--output", help="write the per document results to this json file")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as out_dir:
+        for category in args.categories:
+            results.extend(run_category(category, args.extractors, out_dir))
+    for category in args.categories:
+        docs = [r for r in results if r["category"] == category]
+        pages = sum(r["pages"] for r in docs)
+        for name in args.extractors:
+            seconds = sum(r["extractors"][name]["seconds"] for r in docs)
+            matches = sum(r["extractors"][name]["matches"] for r in docs)
+            print(f"{category} {name}: {pages / seconds if seconds else 0:.1f} pages/s, {matches}/{len(docs)} documents match {args.extractors[0]}")
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(results, fp, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Benchmark of CustomRoadMapConverter.receive_layout against the recursive receiver it replaced.
+
+The pdf is laid out with pdfminer once per receiver. Both the overall pages/second and the time spent inside
+receive_layout itself are reported, and the lines produced by both receivers are checked to be identical.
+
+To run (from src/): python3 -m benchmarks.layout ../static/corpora/data/aeo/AEO2020.pdf
+"""
+
+import argparse
+from time import perf_counter
+
+from pdfminer.layout import LTChar, LTPage, LTTextBox, LTTextLine, LTAnno
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+
+from benchmarks.line_filter import get_doc_config
+from utils.pdf import CustomRoadMapConverter, TextLine
+
+
+class LegacyRoadMapConverter(CustomRoadMapConverter):
+    """The layout receiver as implemented before the single pass rewrite, kept as the baseline.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rows = []
+
+    def receive_layout(self, ltpage):
+        def render(item, page_number):
+            if isinstance(item, LTPage) or isinstance(item, LTTextBox):
+                for child in item:
+                    render(child, page_number)
+            elif isinstance(item, LTTextLine):
+                line_elements = []
+                curr_element = None
+                for child in item:
+                    if isinstance(child, LTChar):
+                        if curr_element is None or curr_element.size is None:
+                            curr_element = TextLine(round(child.size), child.get_text(), page_number)
+                        elif curr_element.size != round(child.size):
+                            if curr_element.text:
+                                curr_element.text = ' '.join(curr_element.text.split()).strip()
+                                line_elements.append(curr_element)
+                            curr_element = TextLine(round(child.size), child.get_text(), page_number)
+                        else:
+                            curr_element.text += child.get_text()
+                    elif isinstance(child, LTAnno):
+                        if curr_element is None:
+                            curr_element = TextLine(None, child.get_text(), page_number)
+                        else:
+                            curr_element.text += child.get_text()
+                line_elements.append(curr_element if curr_element is not None else TextLine())
+                self.lines.extend(line_elements)
+                for child in item:
+                    render(child, page_number)
+            return
+        render(ltpage, self.page_number)
+        self.page_number += 1
+        self.rows = sorted(self.rows, key=lambda x: (x[0], -x[2]))
+        self.result = ltpage
+
+
+def run(pdf_file, laparams, device_class):
+    """Lays a pdf out with the given receiver.
+
+    Returns:
+        tuple: (number of pages, total seconds, seconds inside receive_layout, lines)
+    """
+    receive_time = 0.0
+
+    class TimedDevice(device_class):
+        def receive_layout(self, ltpage):
+            nonlocal receive_time
+            start = perf_counter()
+            super().receive_layout(ltpage)
+            receive_time += perf_counter() - start
+
+    start = perf_counter()
+    with open(pdf_file, 'rb') as in_file:
+        doc = PDFDocument(PDFParser(in_file))
+        rsrcmgr = PDFResourceManager()
+        device = TimedDevice(rsrcmgr, laparams=laparams)
+        interpreter = PDFPageInterpreter(rsrcmgr, device)
+        n_pages = 0
+        for page in PDFPage.create_pages(doc):
+            interpreter.process_page(page)
+            n_pages += 1
+    return n_pages, perf_counter() - start, receive_time, device.lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("pdf", help="reference pdf, its .conf alongside it is merged into the category config")
+    parser.add_argument("--repeat", type=int, default=3, help="layouts per receiver, the fastest is reported")
+    args = parser.parse_args()
+
+    _, config = get_doc_config(args.pdf)
+    receivers = (("legacy", LegacyRoadMapConverter), ("single pass", CustomRoadMapConverter))
+    best = {name: (float("inf"), float("inf")) for name, _ in receivers}
+    results = {}
+    # alternate the receivers so that both see the same warm caches
+    for _ in range(args.repeat):
+        for name, device_class in receivers:
+            n_pages, total, receive, lines = run(args.pdf, config['laparams'], device_class)
+            best[name] = (min(best[name][0], total), min(best[name][1], receive))
+            results[name] = lines
+    for name, (total, receive) in best.items():
+        print(f"{name:12} {n_pages / total:7.2f} pages/s overall, receive_layout {receive * 1000 / n_pages:7.2f} ms/page "
+              f"({n_pages / receive:8.1f} pages/s)")
+    assert results["legacy"] == results["single pass"], "receivers produced different lines"
+
+
+if __name__ == "__main__":
+    main()
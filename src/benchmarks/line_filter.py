@@ -0,0 +1,88 @@
+"""Micro-benchmark of the config line filter (converter.LineFilter) against the per-line filter it replaced.
+
+The pdf is laid out once (or replayed from the layout cache) and both filters are then timed over the same pages,
+reporting the cost per line. The filtered output of both is checked to be identical.
+
+To run (from src/): python3 -m benchmarks.line_filter ../static/corpora/data/aeo/AEO2020.pdf
+"""
+
+import argparse
+import os
+import re
+import sys
+from time import perf_counter
+
+from converter import EIAAEOConverter, EIAIEOConverter, LineFilter
+
+
+def legacy_line_filter(lines, exclusions_page, exclusions_exact, inclusions_font):
+    """The line filter as implemented before LineFilter, kept as the baseline.
+    """
+    filtered_lines = []
+    for line in lines:
+        exclude = False
+        if line['page'] in exclusions_page:
+            continue
+        if -1 in exclusions_page:
+            ind = exclusions_page.index(-1)
+            if ind == 0 or ind == 1:
+                sys.exit(0)
+            from_ = exclusions_page[ind - 2]
+            to_ = exclusions_page[ind - 1]
+            if line['page'] >= from_ and line['page'] <= to_:
+                continue
+        for regex in exclusions_exact:
+            if re.match(regex, line['text']):
+                exclude = True
+                break
+        if exclude:
+            continue
+        if line['size'] not in inclusions_font:
+            if line['size'] < 18:
+                continue
+        filtered_lines.append(line)
+    return filtered_lines
+
+
+def get_doc_config(pdf_file):
+    converter = EIAIEOConverter() if os.sep + "ieo" in os.path.abspath(pdf_file) else EIAAEOConverter()
+    conf = os.path.splitext(pdf_file)[0] + ".conf"
+    config = converter._get_doc_config(converter.config, converter.perdoc_config, filename=pdf_file,
+                                       config=conf if os.path.isfile(conf) else None, outfile=os.devnull)
+    converter.dir_path = os.path.dirname(pdf_file)
+    return converter, config
+
+
+def time_filter(fn, pages, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        out = [fn(lines) for lines in pages]
+        best = min(best, perf_counter() - start)
+    return best, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("pdf", help="pdf to lay out, its .conf alongside it is merged into the category config")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    converter, config = get_doc_config(args.pdf)
+    pages = list(converter._iter_page_lines(args.pdf, config['laparams'], extractor=config['extractor']))
+    n_lines = sum(len(lines) for lines in pages)
+    exclusions_page, exclusions_exact, inclusions_font = config['exclusions_page'], config['exclusions_exact'], config['inclusions_font']
+    # the legacy filter worked on the json form of the lines
+    dict_pages = [[line.to_dict() for line in lines] for lines in pages]
+    legacy, legacy_out = time_filter(lambda lines: legacy_line_filter(lines, exclusions_page, exclusions_exact, inclusions_font), dict_pages, args.repeat)
+    line_filter = LineFilter(exclusions_exact, exclusions_page, inclusions_font)
+    compiled, compiled_out = time_filter(line_filter.filter, pages, args.repeat)
+    compiled_out = [[line.to_dict() for line in lines] for lines in compiled_out]
+    assert legacy_out == compiled_out, "compiled filter output differs from the legacy filter"
+    print(f"{args.pdf}: {len(pages)} pages, {n_lines} lines, {len(exclusions_exact)} exact exclusions")
+    print(f"legacy:   {legacy * 1e9 / n_lines:8.1f} ns/line")
+    print(f"compiled: {compiled * 1e9 / n_lines:8.1f} ns/line ({legacy / compiled:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
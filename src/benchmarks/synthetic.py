@@ -0,0 +1,155 @@
+"""Synthetic pdf corpus for the conversion benchmarks, so throughput can be measured without the EIA pdfs.
+
+The pdfs are written directly (standard Type1 Helvetica fonts, Flate compressed content streams) using only the
+standard library. Each page imitates the layout of an EIA outlook: a running header above the fold, a chapter title,
+multi-column body text with section headings, figure captions, words hyphenated across lines and non-breaking
+spaces, footnotes and a page number. The same seed always produces the same corpus.
+
+To run (from src/): python3 -m benchmarks.synthetic ../static/synthetic --pages 40 40 120
+"""
+
+import argparse
+import os
+import random
+import zlib
+
+PAGE_WIDTH = 612
+PAGE_HEIGHT = 792
+MARGIN = 40
+HEADER = "U.S. Energy Information Administration"
+WORDS = ("energy outlook coal natural gas renewable electricity generation capacity petroleum consumption "
+         "efficiency nuclear wind solar prices demand supply transportation industrial residential commercial "
+         "emissions production imports exports liquids biofuels refinery household vehicle battery storage "
+         "transmission reference case projection growth economic").split()
+# (font resource, size) of each kind of text on a page
+TITLE = ("F2", 22)
+HEADING = ("F2", 14)
+CAPTION = ("F2", 11)
+BODY = ("F1", 10)
+FOOTNOTE = ("F1", 8)
+# rough Helvetica advance width as a share of the font size, used to fill the columns
+CHAR_WIDTH = 0.5
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _text(ops, font, x, y, text):
+    name, size = font
+    ops.append(f"BT /{name} {size} Tf {x} {y} Td ({_escape(text)}) Tj ET")
+
+
+def _body_lines(rnd, n_chars):
+    """Lines of body text of at most n_chars characters, occasionally hyphenating a word across two lines.
+    """
+    carry = None
+    while True:
+        words = [carry] if carry else []
+        carry = None
+        while len(" ".join(words)) < n_chars - 12:
+            words.append(rnd.choice(WORDS))
+        if rnd.random() < 0.15:
+            word = rnd.choice([w for w in WORDS if len(w) > 6])
+            cut = rnd.randint(2, len(word) - 3)
+            words.append(word[:cut] + "-")
+            carry = word[cut:]
+        line = " ".join(words)
+        if rnd.random() < 0.1:
+            line = line.replace(" ", "\xa0", 1)
+        yield line
+
+
+def _page_content(rnd, page_number, columns):
+    ops = []
+    _text(ops, FOOTNOTE, MARGIN, PAGE_HEIGHT - 30, HEADER)
+    _text(ops, TITLE, MARGIN, PAGE_HEIGHT - 80, f"Chapter {page_number + 1} " + " ".join(rnd.sample(WORDS, 3)).title())
+    column_width = (PAGE_WIDTH - 2 * MARGIN) / columns
+    n_chars = int((column_width - 15) / (BODY[1] * CHAR_WIDTH))
+    lines = _body_lines(rnd, n_chars)
+    figures = 0
+    for column in range(columns):
+        x = round(MARGIN + column * column_width)
+        y = PAGE_HEIGHT - 120
+        while y > 110:
+            kind = rnd.random()
+            if kind < 0.25:
+                _text(ops, HEADING, x, y, " ".join(rnd.sample(WORDS, rnd.randint(2, 4))).title())
+                y -= 22
+            elif kind < 0.35:
+                figures += 1
+                _text(ops, CAPTION, x, y, f"Figure {page_number + 1}-{figures}. " + " ".join(rnd.sample(WORDS, 3)))
+                y -= 18
+            for _ in range(min(rnd.randint(4, 10), int((y - 100) / 12))):
+                _text(ops, BODY, x, y, next(lines))
+                y -= 12
+            y -= 10
+    _text(ops, FOOTNOTE, MARGIN, 60, "Source: " + " ".join(rnd.sample(WORDS, 6)))
+    _text(ops, ("F1", 9), PAGE_WIDTH // 2, 30, str(page_number + 1))
+    return "\n".join(ops).encode("latin-1")
+
+
+def generate_pdf(path, n_pages, seed=0, columns=2):
+    """Writes a synthetic pdf.
+
+    Args:
+        path (str): path of the pdf to write
+        n_pages (int): number of pages
+        seed (int, optional): seed of the page content. Defaults to 0.
+        columns (int, optional): number of text columns per page. Defaults to 2.
+    """
+    rnd = random.Random(seed)
+    n_objects = 4 + 2 * n_pages
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{5 + 2 * i} 0 R' for i in range(n_pages))}] /Count {n_pages} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+    ]
+    for i in range(n_pages):
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+                       f"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents {6 + 2 * i} 0 R >>".encode())
+        content = zlib.compress(_page_content(rnd, i, columns))
+        objects.append(b"<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream" % (len(content), content))
+    out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, obj)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (n_objects + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (n_objects + 1, xref)
+    with open(path, "wb") as fp:
+        fp.write(out)
+
+
+def generate_corpus(dir_path, page_counts, seed=0, columns=2):
+    """Writes one synthetic pdf per page count to dir_path, named synthetic_<i>.pdf.
+
+    Returns:
+        list: paths of the pdfs written
+    """
+    os.makedirs(dir_path, exist_ok=True)
+    paths = []
+    for i, n_pages in enumerate(page_counts):
+        path = os.path.join(dir_path, f"synthetic_{i}.pdf")
+        generate_pdf(path, n_pages, seed=seed + i, columns=columns)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("dir", help="directory to write the pdfs to")
+    parser.add_argument("--pages", type=int, nargs="+", default=[40, 40, 40, 40], help="page count of each pdf")
+    parser.add_argument("--columns", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for path in generate_corpus(args.dir, args.pages, args.seed, args.columns):
+        print(f"wrote {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 """Code for conversion of pdf files to text
 
 This file converts a pdf file to it's structured json representation. The RoadmapPDFConverter class
-is the base class which contains the logic for conversion using pdfminer.six. Each different document
+is the base class which contains the logic for conversion using pdfminer.six (or another layout backend, see utils/extractors.py). Each different document
 category (e.g. steo, ieo, tech_briefs) has a different subclass implementation of RoadmapPDFConverter 
 mainly to pass in the correct directories that contain the pdfs and to implement any organisation-specific filtering.
 
@@ -11,21 +11,172 @@ To run: python3 converter.py
 from pdfminer.high_level import extract_text, extract_pages, extract_text_to_fp
 from pdfminer.converter import TextConverter
 from pdfminer.layout import LAParams, LTTextContainer, LTChar
-from pdfminer.pdfdocument import PDFDocument
-from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
-from pdfminer.pdfpage import PDFPage
-from pdfminer.pdfparser import PDFParser
 from collections import Counter
-from io import StringIO
 from multiprocessing import Process, Pool
 import os
 import json
 import sys
 import re
+import hashlib
 from bs4 import BeautifulSoup
-from utils.pdf import CustomRoadMapConverter
+from utils.pdf import TextLine
+from utils.layout_cache import LayoutCache
+from utils.text import TextNormaliser
+from utils.extractors import DEFAULT_EXTRACTOR, count_pages, get_extractor
 
 NUM_CPU = os.cpu_count() - 1 if os.cpu_count() > 1 else 1
+# documents longer than this many pages are laid out in parallel page ranges by bulk_convert
+PAGE_CHUNK_SIZE = 32
+# bump whenever a change to the conversion logic changes the _structured.json output,
+# this invalidates every entry of the conversion manifests
+CONVERTER_VERSION = 1
+MANIFEST_FILE_NAME = "conversion_manifest.json"
+LAYOUT_CACHE_DIR_NAME = ".layout_cache"
+
+def file_hash(path, block_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        for block in iter(lambda: fp.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def config_hash(config):
+    """Hashes a document config as returned by RoadmapPDFConverter._get_doc_config. The input and output paths
+    are left out so that a document's hash does not depend on where the corpus lives.
+    """
+    config = {k: v for k, v in config.items() if k not in ("filename", "output_path")}
+    serialised = json.dumps(config, sort_keys=True, default=lambda o: vars(o))
+    return hashlib.sha256(serialised.encode("utf-8")).hexdigest()
+
+
+class ConversionManifest:
+    """Record of the documents in a directory that have already been converted. Each pdf is keyed by the hash of its
+    content, the hash of its merged config and the converter version, so a document only needs converting again
+    when one of these changes or its _structured.json has been modified or removed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.isfile(path):
+            with open(path, "r") as fp:
+                self.entries = json.load(fp)
+        self.hits = 0
+        self.misses = 0
+
+    def entry(self, pdf_file, config):
+        return {"pdf_hash": file_hash(pdf_file), "config_hash": config_hash(config), "version": CONVERTER_VERSION}
+
+    def is_valid(self, pdf_file, entry, output_path):
+        """Checks whether the existing output of a pdf is still valid for the given entry, counting hits and misses.
+        """
+        recorded = self.entries.get(os.path.basename(pdf_file), None)
+        valid = recorded is not None and os.path.isfile(output_path) \
+            and all(recorded.get(k) == v for k, v in entry.items()) \
+            and recorded.get("output_hash") == file_hash(output_path)
+        if valid:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return valid
+
+    def record(self, pdf_file, entry, output_path):
+        self.entries[os.path.basename(pdf_file)] = {**entry, "output_hash": file_hash(output_path)}
+
+    def save(self):
+        with open(self.path, "w") as fp:
+            json.dump(self.entries, fp, indent=4, sort_keys=True)
+
+    def report(self):
+        print(f"conversion cache {self.path}: {self.hits} hits, {self.misses} misses")
+
+
+def _layout_page_range(extractor, pdf_file, laparams, start, stop):
+    """Pool task laying out a single page range of a pdf, see RoadmapPDFConverter.mp_parse_multiple_to_json
+    """
+    return list(get_extractor(extractor).iter_pages(pdf_file, laparams, start, stop))
+
+
+class LineFilter:
+    """Line filter compiled once from the filtering items of a document config (see RoadmapPDFConverter._init_config):
+
+        exclusions_exact: regexes, lines whose text matches any of them from the start are removed
+        exclusions_page: page numbers whose lines are removed. A -1 following two page numbers also removes
+            every page in between, e.g. [111, 128, -1] removes pages 111 to 128.
+        inclusions_font: font sizes that are kept, any font size of 18 or over is kept regardless as it is
+            most definitely a heading.
+
+    The exact exclusions are compiled into a single alternation, the page exclusions into a set plus an interval
+    that is only checked once per page, and the font inclusions into a set.
+    """
+
+    def __init__(self, exclusions_exact=None, exclusions_page=None, inclusions_font=None):
+        exclusions_exact = exclusions_exact or []
+        exclusions_page = exclusions_page or []
+        self.inclusions_font = frozenset(inclusions_font or [])
+        self.exclusions_page = frozenset(exclusions_page)
+        self.exclusion_range = None
+        if -1 in exclusions_page:
+            ind = exclusions_page.index(-1)
+            if ind == 0 or ind == 1:
+                print("Can't have -1 as first or second element of the page exclusions, \
+                    the -1 must follow the min, max page you want to exclude.\
+                        e.g. [111, 128, -1] excludes pages between 111 and 128.")
+                sys.exit(0)
+            self.exclusion_range = (exclusions_page[ind - 2], exclusions_page[ind - 1])
+        self._match = self._compile_exclusions(exclusions_exact)
+
+    @staticmethod
+    def _compile_exclusions(exclusions_exact):
+        """Returns a function with the semantics of any(re.match(regex, text) for regex in exclusions_exact)
+        """
+        if not exclusions_exact:
+            return None
+        # back references would point at the wrong group once the regexes are joined
+        if not any(re.search(r"\\\d|\(\?P=", regex) for regex in exclusions_exact):
+            try:
+                return re.compile("|".join(f"(?:{regex})" for regex in exclusions_exact)).match
+            except re.error:
+                # e.g. global flags that are only valid at the start of a regex
+                pass
+        compiled = [re.compile(regex) for regex in exclusions_exact]
+        return lambda text: any(regex.match(text) for regex in compiled)
+
+    def is_page_excluded(self, page):
+        if page in self.exclusions_page:
+            return True
+        return self.exclusion_range is not None and self.exclusion_range[0] <= page <= self.exclusion_range[1]
+
+    def filter(self, lines):
+        """Filters the lines of a page (or any run of lines) in a single pass.
+
+        Args:
+            lines (list): TextLine records
+
+        Returns:
+            list: the lines that are kept
+        """
+        match = self._match
+        inclusions_font = self.inclusions_font
+        filtered_lines = []
+        last_page = None
+        page_excluded = False
+        for line in lines:
+            page = line.page
+            if page != last_page:
+                page_excluded = self.is_page_excluded(page)
+                last_page = page
+            if page_excluded:
+                continue
+            if match is not None and match(line.text):
+                continue
+            size = line.size
+            if size < 18 and size not in inclusions_font:
+                continue
+            filtered_lines.append(line)
+        return filtered_lines
+
 
 class RoadmapPDFConverter:
     """
@@ -35,11 +186,14 @@ class RoadmapPDFConverter:
     dir_path = ""
     config_path = os.path.join(os.path.dirname(__file__), "default_scraping_config.json")
     laparams = None
+    # cache the raw layout of each pdf so config changes other than laparams don't need pdfminer to run again
+    use_layout_cache = True
 
     def __init__(self, custom_filter=None, perdoc_config=False, **kwargs):
         self.custom_filter = None
         if custom_filter:
             self.custom_filter = custom_filter
+        self.normaliser = TextNormaliser(self.custom_filter)
         self.perdoc_config = perdoc_config
         self._load_config()
         self._init_config(**kwargs)
@@ -86,9 +240,9 @@ class RoadmapPDFConverter:
         with open(self.config_path, "r") as fp:
             self.config = json.load(fp)
 
-    def _init_config(self, exclusions_exact=[], exclusions_page=[], inclusions_font=[], table_of_contents=[], laparams=None, to_filter=False, **kwargs):
+    def _init_config(self, exclusions_exact=[], exclusions_page=[], inclusions_font=[], table_of_contents=[], laparams=None, to_filter=False, extractor=DEFAULT_EXTRACTOR, **kwargs):
         """In the case of per doc configs, the class configuration parameters need to be updated for each individual pdf.
-        This will be called from the init doc config function.
+        This will be called from the init doc config function. extractor names the layout backend, see utils/extractors.py.
         """
         if laparams:
             self.laparams = LAParams(**laparams)
@@ -99,22 +253,94 @@ class RoadmapPDFConverter:
         self.exclusions_exact = exclusions_exact
         self.exclusions_page = exclusions_page
         self.inclusions_font = inclusions_font
-        return {**kwargs, "laparams": self.laparams, "to_filter": self.to_filter, "table_of_contents": self.table_of_contents, "exclusions_exact": self.exclusions_exact, "exclusions_page": self.exclusions_page, "inclusions_font": self.inclusions_font}
+        self.extractor = extractor
+        return {**kwargs, "extractor": self.extractor, "laparams": self.laparams, "to_filter": self.to_filter, "table_of_contents": self.table_of_contents, "exclusions_exact": self.exclusions_exact, "exclusions_page": self.exclusions_page, "inclusions_font": self.inclusions_font}
 
-    def parse_multiple_to_json(self):
-        paths = self._get_pdf_and_config_paths()
+    def parse_multiple_to_json(self, use_cache=True):
+        paths = self._get_stale_pdf_and_config_paths() if use_cache else self._get_pdf_and_config_paths()
         for item in paths:
             self._parse_pdf_to_json(**item)
+            if use_cache:
+                self._record_converted(item)
+        if use_cache:
+            self._save_manifest()
+
+    def mp_parse_multiple_to_json(self, page_chunk_size=None, use_cache=True):
+        """Converts every pdf in self.dir_path using a process pool, one worker per document.
 
-    def mp_parse_multiple_to_json(self):
-        paths = self._get_pdf_and_config_paths()
-        pool = Pool(processes=NUM_CPU/2 if NUM_CPU != 1 else 1)
-        a = [pool.apply_async(self._mp_parse_pdf_to_json, kwds=path)
-             for path in paths]
-        for future in a:
-            res = future.get()
+        Args:
+            page_chunk_size (int, optional): documents with more pages than this are split into page ranges of
+                page_chunk_size pages which are laid out in parallel across the same pool, then stitched back
+                together in page order. Defaults to None, i.e. a single worker per document.
+            use_cache (bool, optional): skip documents whose _structured.json is still valid according to the
+                directory's conversion manifest. Defaults to True.
+        """
+        paths = list(self._get_stale_pdf_and_config_paths() if use_cache else self._get_pdf_and_config_paths())
+        # terminated on leaving the block with an exception (e.g. a corrupt pdf in a page range), so no workers leak
+        with Pool(processes=NUM_CPU // 2 if NUM_CPU != 1 else 1) as pool:
+            split = []
+            whole = []
+            for path in paths:
+                n_pages = count_pages(path['filename']) if page_chunk_size else 0
+                if page_chunk_size and n_pages > page_chunk_size:
+                    split.append((path, n_pages))
+                else:
+                    whole.append(path)
+            # queue the page ranges of the large documents first, they are the ones that set the wall-clock time
+            split_futures = []
+            for path, n_pages in split:
+                config = self._get_doc_config(self.config, self.perdoc_config, **path)
+                if self._is_layout_cached(path['filename'], config['laparams'], config['extractor']):
+                    # replaying the cached layout is cheaper than laying the pages out again
+                    whole.append(path)
+                    continue
+                futures = [pool.apply_async(_layout_page_range, args=(config['extractor'], path['filename'], config['laparams'], start, min(start + page_chunk_size, n_pages)))
+                           for start in range(0, n_pages, page_chunk_size)]
+                split_futures.append((path, futures))
+            a = [(path, pool.apply_async(self._mp_parse_pdf_to_json, kwds=path))
+                 for path in whole]
+            results = []
+            for path, futures in split_futures:
+                pages = (lines for future in futures for lines in future.get())
+                results.append((path, self._mp_parse_pdf_to_json(pages=pages, **path)))
+            for path, future in a:
+                results.append((path, future.get()))
+            pool.close()
+            pool.join()
+        for path, res in results:
             if res[1] == 0:
                 print(f"convert failed somewhere for {res[0]}")
+            elif use_cache:
+                self._record_converted(path)
+        if use_cache:
+            self._save_manifest()
+
+    def _get_stale_pdf_and_config_paths(self):
+        """Like _get_pdf_and_config_paths, but skips documents whose _structured.json is still valid
+        according to the conversion manifest of self.dir_path.
+        """
+        self.manifest = ConversionManifest(os.path.join(self.dir_path, MANIFEST_FILE_NAME))
+        self._manifest_entries = {}
+        for path in self._get_pdf_and_config_paths():
+            config = self._get_doc_config(self.config, self.perdoc_config, **path)
+            if not config:
+                yield path
+                continue
+            # the subclass determines the custom filter applied, so it is part of the config
+            entry = self.manifest.entry(path['filename'], {**config, "converter": type(self).__name__})
+            if self.manifest.is_valid(path['filename'], entry, path['outfile']):
+                continue
+            self._manifest_entries[path['filename']] = entry
+            yield path
+
+    def _record_converted(self, path):
+        entry = self._manifest_entries.get(path['filename'], None)
+        if entry and os.path.isfile(path['outfile']):
+            self.manifest.record(path['filename'], entry, path['outfile'])
+
+    def _save_manifest(self):
+        self.manifest.save()
+        self.manifest.report()
 
     def _gen_pdf(self):
         dir_files = os.listdir(self.dir_path)
@@ -142,46 +368,83 @@ class RoadmapPDFConverter:
 
     def _parse_pdf_to_json(self, **kwargs):
         self._init_doc_config(**kwargs)
-        chunks = self._parse(self.filename)
-        chunks['doc'] = self._merge_chunks(chunks['doc'])
-        with open(self.output_path, "w") as wfp:
-            json.dump(chunks, wfp)
+        print(f"converting {self.filename}...")
+        toc = []
+        chunks = self._iter_chunks(
+            self._create_text_line_generator(self.filename), self.table_of_contents, toc)
+        self._dump_structured_json(self.output_path, self._iter_merged_chunks(chunks), toc)
+
+    def _mp_parse_pdf_to_json(self, pages=None, **kwargs):
+        """Converts a single pdf to its _structured.json representation.
 
-    def _mp_parse_pdf_to_json(self, **kwargs):
+        Args:
+            pages (iterable, optional): already laid out pages of the pdf, in page order. If None the pdf is laid out here.
+        """
         filename = kwargs.get("filename", None)
         config = self._get_doc_config(
             self.config, self.perdoc_config, **kwargs)
         if not config:
             return (None, 0)
-        chunks = self._mp_parse(**config)
-        chunks['doc'] = self._merge_chunks(chunks['doc'])
         output_path = config.get("output_path", None)
         if output_path:
-            with open(output_path, "w") as wfp:
-                json.dump(chunks, wfp)
-                return (filename, 1)
+            print(f"converting {filename}...")
+            toc = []
+            chunks = self._iter_chunks(
+                self._mp_create_text_line_generator(pages=pages, **config), config.get("table_of_contents", None), toc)
+            self._dump_structured_json(output_path, self._iter_merged_chunks(chunks), toc)
+            return (filename, 1)
         else:
             fn = config.get("filename", "unknown")
             print(f"output_path not found in config for {fn}")
             return (filename, 0)
 
+    def _dump_structured_json(self, output_path, chunks, toc):
+        """Writes the structured json representation of a document chunk by chunk as the chunks are produced,
+        rather than building the whole document in memory first. The output is identical to
+        json.dump({"doc": chunks, "table_of_contents": toc}).
+
+        Args:
+            output_path (str): path of the _structured.json file to write
+            chunks (iterable): merged TextLine chunks of the document
+            toc (list): table of contents TextLine chunks, only complete once chunks has been exhausted
+        """
+        # write alongside and move into place so a failed conversion never leaves a truncated file behind
+        tmp_path = output_path + ".tmp"
+        with open(tmp_path, "w") as wfp:
+            wfp.write('{"doc": [')
+            for i, chunk in enumerate(chunks):
+                if i:
+                    wfp.write(", ")
+                wfp.write(json.dumps(chunk.to_dict()))
+            wfp.write('], "table_of_contents": ')
+            json.dump([chunk.to_dict() for chunk in toc], wfp)
+            wfp.write("}")
+        os.replace(tmp_path, output_path)
+
     def _merge_chunks(self, chunks):
-        merged_chunks = []
-        acc_chunk = {}
-        i = 0
-        while i < len(chunks):
-            if acc_chunk == {}:
-                acc_chunk = chunks[i]
+        return list(self._iter_merged_chunks(chunks))
+
+    def _iter_merged_chunks(self, chunks):
+        """Merges consecutive chunks of the same font size, yielding each merged chunk as soon as
+        a chunk of a different size follows it.
+        """
+        acc_chunk = None
+        for chunk in chunks:
+            if acc_chunk is None:
+                acc_chunk = chunk
+                parts = [chunk.text]
+            elif acc_chunk.size == chunk.size:
+                parts.append(chunk.text)
             else:
-                if acc_chunk['size'] == chunks[i]['size']:
-                    acc_chunk['text'] = ' '.join(
-                        [acc_chunk['text'], chunks[i]['text']])
-                else:
-                    merged_chunks.append(acc_chunk)
-                    acc_chunk = chunks[i]
-            i += 1
-        merged_chunks.append(acc_chunk)
-        return merged_chunks
+                acc_chunk.text = ' '.join(parts)
+                yield acc_chunk
+                acc_chunk = chunk
+                parts = [chunk.text]
+        if acc_chunk is None:
+            yield TextLine()
+        else:
+            acc_chunk.text = ' '.join(parts)
+            yield acc_chunk
 
     def _is_pdf(self, file_name):
         file_name = re.match(r"(.*)\.pdf$", file_name)
@@ -202,229 +465,152 @@ class RoadmapPDFConverter:
 
     def _mp_parse(self, **kwargs):
         fn = kwargs.get("filename", None)
-        table_of_contents = kwargs.get("table_of_contents", None)
         print(f"converting {fn}...")
-        # extract table of contents
         toc = []
-        # extract rest
-        line_gen = self._mp_create_text_line_generator(**kwargs)
-        chunks = []
-        curr_chunk = {"text": "", "page": None, "size": None}
-        for line in line_gen:
-            if curr_chunk['text'] == "":
-                curr_chunk = line
-            elif line['size'] != curr_chunk['size']:
-                preproc_chunk = self._preprocess(curr_chunk)
-                if preproc_chunk['text'] != "":
-                    chunks.append(preproc_chunk)
-                if curr_chunk['page'] in table_of_contents:
-                    toc.append(curr_chunk)
-                curr_chunk = line
-            elif line['page'] != curr_chunk['page']:
-                # if the page changes, but not necessarily different sizes
-                if curr_chunk['page'] in table_of_contents:
-                    toc.append(curr_chunk)
-                curr_chunk["text"] = ' '.join(
-                    [curr_chunk['text'], line['text']])
-            else:
-                curr_chunk["text"] = ' '.join(
-                    [curr_chunk['text'], line['text']])
-        if curr_chunk['page'] in table_of_contents:
-            toc.append(curr_chunk)
-        else:
-            # chunks.append(curr_chunk)
-            preproc_chunk = self._preprocess(curr_chunk)
-            if preproc_chunk['text'] != "":
-                chunks.append(preproc_chunk)
+        chunks = list(self._iter_chunks(
+            self._mp_create_text_line_generator(**kwargs), kwargs.get("table_of_contents", None), toc))
         return {"doc": chunks, "table_of_contents": toc}
 
     def _parse(self, pdf_file):
         print(f"converting {self.filename}...")
-        # extract table of contents
         toc = []
-        # extract rest
-        line_gen = self._create_text_line_generator(pdf_file)
-        chunks = []
-        curr_chunk = {"text": "", "page": None, "size": None}
+        chunks = list(self._iter_chunks(
+            self._create_text_line_generator(pdf_file), self.table_of_contents, toc))
+        return {"doc": chunks, "table_of_contents": toc}
+
+    def _iter_chunks(self, line_gen, table_of_contents, toc):
+        """Groups consecutive lines of the same font size into preprocessed chunks, yielding each chunk
+        as soon as a line of a different size ends it. Chunks that fall on table of contents pages are
+        appended to toc as they are found.
+
+        Args:
+            line_gen (iterable): TextLine records
+            table_of_contents (list): page numbers of the table of contents
+            toc (list): accumulator for table of contents chunks
+
+        Yields:
+            TextLine: preprocessed chunk
+        """
+        curr_chunk = TextLine(None, "", None)
+        # the text of the current chunk is only joined together once the chunk is complete
+        parts = [""]
         for line in line_gen:
-            if curr_chunk['text'] == "":
+            if parts[0] == "":
                 curr_chunk = line
-            elif line['size'] != curr_chunk['size']:
+                parts = [line.text]
+            elif line.size != curr_chunk.size:
+                curr_chunk.text = ' '.join(parts)
                 preproc_chunk = self._preprocess(curr_chunk)
-                if preproc_chunk['text'] != "":
-                    chunks.append(preproc_chunk)
-                if curr_chunk['page'] in self.table_of_contents:
+                if preproc_chunk.text != "":
+                    yield preproc_chunk
+                if curr_chunk.page in table_of_contents:
                     toc.append(curr_chunk)
                 curr_chunk = line
-            elif line['page'] != curr_chunk['page']:
+                parts = [line.text]
+            elif line.page != curr_chunk.page:
                 # if the page changes, but not necessarily different sizes
-                if curr_chunk['page'] in self.table_of_contents:
+                if curr_chunk.page in table_of_contents:
                     toc.append(curr_chunk)
-                curr_chunk["text"] = ' '.join(
-                    [curr_chunk['text'], line['text']])
+                parts.append(line.text)
             else:
-                curr_chunk["text"] = ' '.join(
-                    [curr_chunk['text'], line['text']])
-        if curr_chunk['page'] in self.table_of_contents:
+                parts.append(line.text)
+        curr_chunk.text = ' '.join(parts)
+        if curr_chunk.page in table_of_contents:
             toc.append(curr_chunk)
         else:
-            # chunks.append(curr_chunk)
             preproc_chunk = self._preprocess(curr_chunk)
-            if preproc_chunk['text'] != "":
-                chunks.append(preproc_chunk)
-        return {"doc": chunks, "table_of_contents": toc}
+            if preproc_chunk.text != "":
+                yield preproc_chunk
 
     def _mp_line_filter(self, lines, **kwargs):
-        exclusions_page = kwargs.get("exclusions_page", None)
-        exclusions_exact = kwargs.get("exclusions_exact", None)
-        inclusions_font = kwargs.get("inclusions_font", None)
-        filtered_lines = []
-        for line in lines:
-            exclude = False
-            # filter page number
-            if line['page'] in exclusions_page:
-                continue
-            if -1 in exclusions_page:
-                ind = exclusions_page.index(-1)
-                if ind == 0 or ind == 1:
-                    print("Can't have -1 as first or second element of the page exclusions, \
-                        the -1 must follow the min, max page you want to exclude.\
-                            e.g. [111, 128, -1] excludes pages between 111 and 128.")
-                    sys.exit(0)
-                from_ = exclusions_page[ind - 2]
-                to_ = exclusions_page[ind - 1]
-                if line['page'] >= from_ and line['page'] <= to_:
-                    continue
-            # filter exact string line matches
-            for regex in exclusions_exact:
-                if re.match(regex, line['text']):
-                    exclude = True
-                    break
-            if exclude:
-                continue
-            # filter font size
-            if line['size'] not in inclusions_font:
-                # any font size over 18 regardless of included or not, will be
-                # included as it is most definitely a heading.
-                if line['size'] < 18:
-                    continue
-
-            filtered_lines.append(line)
-        return filtered_lines
+        return LineFilter(kwargs.get("exclusions_exact", None), kwargs.get("exclusions_page", None),
+                          kwargs.get("inclusions_font", None)).filter(lines)
 
     def _line_filter(self, lines):
         """line filtering based on configuration items, removes unwanted lines, string matches etc.
 
         Args:
-            soup ([type]): [description]
+            lines (list): TextLine records
         """
-        filtered_lines = []
-        for line in lines:
-            exclude = False
-            # filter page number
-            if line['page'] in self.exclusions_page:
-                continue
-            if -1 in self.exclusions_page:
-                ind = self.exclusions_page.index(-1)
-                if ind == 0 or ind == 1:
-                    print("Can't have -1 as first or second element of the page exclusions, \
-                        the -1 must follow the min, max page you want to exclude.\
-                            e.g. [111, 128, -1] excludes pages between 111 and 128.")
-                    sys.exit(0)
-                from_ = self.exclusions_page[ind - 2]
-                to_ = self.exclusions_page[ind - 1]
-                if line['page'] >= from_ and line['page'] <= to_:
-                    continue
-            # filter exact string line matches
-            for regex in self.exclusions_exact:
-                if re.match(regex, line['text']):
-                    exclude = True
-                    break
-            if exclude:
-                continue
-            # filter font size
-            if line['size'] not in self.inclusions_font:
-                # any font size over 18 regardless of included or not, will be
-                # included as it is most definitely a heading.
-                if line['size'] < 18:
-                    continue
-
-            filtered_lines.append(line)
-        return filtered_lines
+        return LineFilter(self.exclusions_exact, self.exclusions_page, self.inclusions_font).filter(lines)
 
     def _preprocess(self, line):
         """final preprocessing applied to paragraph format of text. This is mainly used to merge words that
-        are split over a new line (e.g. effici-\nency --> efficiency) and to clean whitespace.
+        are split over a new line (e.g. effici-\nency --> efficiency) and to clean whitespace, see utils/text.py.
 
         Args:
-            line (dict): json output format (e.g. {"page": 7, "size": 14, "text": "i am a camel"})
+            line (TextLine): e.g. TextLine(page=7, size=14, text="i am a camel")
 
         Returns:
-            dict: json output format
+            TextLine: the same record with its text preprocessed
         """
-        if self.custom_filter:
-            line['text'] = self.custom_filter(line['text'])
-        new_line = re.sub(r"\(cid:\d+\)", " ", line['text'])
-        new_line = re.sub(r"\-\n\s+", " ", new_line)
-        # remove most prevalent non-ascii chars
-        new_line = re.sub(r"\xa0", " ", new_line)
-        # sub single \n instances in line with space
-        new_line = re.sub(r"\n{1}", " ", new_line)
-        # substitue spaces of more than one with a single space.
-        new_line = re.sub(r"\s\s+", " ", new_line)
-        new_line = new_line.strip()
-        line['text'] = new_line
+        line.text = self.normaliser.normalise(line.text)
         return line
 
-    def _mp_create_text_line_generator(self, **kwargs):
+    def _mp_create_text_line_generator(self, pages=None, **kwargs):
         """Creates a text specific line generator that returns a line of text
-        in the form {size: <size>, text: <text>}. Supports multiprocessing (hopefully)
+        as a TextLine record. Supports multiprocessing (hopefully).
+        Lines are filtered and yielded page by page as the pdf is laid out.
 
         Args:
-            pdf_file (String): the path to the pdf file to be generated
+            pages (iterable, optional): already laid out pages of the pdf, in page order. If None the pdf is laid out here.
         """
-        laparams = kwargs.get("laparams", None)
         to_filter = kwargs.get("to_filter", None)
-        filename = kwargs.get("filename", None)
-        output_string = StringIO()
-        with open(filename, 'rb') as in_file:
-            parser = PDFParser(in_file)
-            doc = PDFDocument(parser)
-            rsrcmgr = PDFResourceManager()
-            device = CustomRoadMapConverter(rsrcmgr, laparams=laparams)
-            interpreter = PDFPageInterpreter(rsrcmgr, device)
-            for page in PDFPage.create_pages(doc):
-                interpreter.process_page(page)
         if to_filter:
-            lines = self._mp_line_filter(device.lines, **kwargs)
-        else:
-            lines = device.lines
-        for line in lines:
-            yield line
+            line_filter = LineFilter(kwargs.get("exclusions_exact", None), kwargs.get("exclusions_page", None),
+                                     kwargs.get("inclusions_font", None))
+        for lines in self._iter_page_lines(kwargs.get("filename", None), kwargs.get("laparams", None), pages,
+                                           kwargs.get("extractor", DEFAULT_EXTRACTOR)):
+            if to_filter:
+                lines = line_filter.filter(lines)
+            for line in lines:
+                yield line
 
     def _create_text_line_generator(self, pdf_file):
         """Creates a text specific line generator that returns a line of text
-        in the form {size: <size>, text: <text>}.
+        as a TextLine record.
 
         Args:
             pdf_file (String): the path to the pdf file to be generated
         """
-        output_string = StringIO()
-        with open(pdf_file, 'rb') as in_file:
-            parser = PDFParser(in_file)
-            doc = PDFDocument(parser)
-            rsrcmgr = PDFResourceManager()
-            print(self.laparams)
-            device = CustomRoadMapConverter(rsrcmgr, laparams=self.laparams)
-            interpreter = PDFPageInterpreter(rsrcmgr, device)
-            for page in PDFPage.create_pages(doc):
-                interpreter.process_page(page)
+        print(self.laparams)
         if self.to_filter:
-            lines = self._line_filter(device.lines)
-        else:
-            lines = device.lines
-        for line in lines:
-            yield line
+            line_filter = LineFilter(self.exclusions_exact, self.exclusions_page, self.inclusions_font)
+        for lines in self._iter_page_lines(pdf_file, self.laparams, extractor=self.extractor):
+            if self.to_filter:
+                lines = line_filter.filter(lines)
+            for line in lines:
+                yield line
+
+    def _iter_page_lines(self, pdf_file, laparams, pages=None, extractor=DEFAULT_EXTRACTOR):
+        """Lays out a pdf one page at a time, yielding the lines of each page as soon as that page
+        has been processed so that only one page of layout is held in memory at once. If the layout of the pdf
+        with these laparams has been cached it is replayed instead, otherwise the layout is written to the cache.
+
+        Args:
+            pdf_file (String): the path to the pdf file to be laid out
+            laparams (LAParams): pdfminer layout parameters
+            pages (iterable, optional): already laid out pages of the pdf, in page order. Defaults to None.
+            extractor (str, optional): name of the layout backend, see utils/extractors.py. Defaults to pdfminer.
+
+        Returns:
+            iterator: the unfiltered lines of each page
+        """
+        if pages is None:
+            pages = get_extractor(extractor).iter_pages(pdf_file, laparams)
+        if not self.use_layout_cache:
+            return pages
+        cache = LayoutCache(os.path.join(self.dir_path, LAYOUT_CACHE_DIR_NAME))
+        cache_path = cache.path(file_hash(pdf_file), laparams, extractor)
+        if os.path.isfile(cache_path):
+            return cache.read(cache_path)
+        return cache.write(cache_path, pages)
+
+    def _is_layout_cached(self, pdf_file, laparams, extractor=DEFAULT_EXTRACTOR):
+        if not self.use_layout_cache:
+            return False
+        cache = LayoutCache(os.path.join(self.dir_path, LAYOUT_CACHE_DIR_NAME))
+        return os.path.isfile(cache.path(file_hash(pdf_file), laparams, extractor))
 
     def get_metadata(self):
         pass
@@ -458,9 +644,11 @@ class EIAIEOConverter(RoadmapPDFConverter):
             config = json.load(fp)
         super().__init__(custom_filter=self._custom_filter, **config)
 
+    header_regex = re.compile(r"^(Table|Figure) [A-Z]?(\d+|\d+\-\d+)\.")
+
     def _custom_filter(self, line):
         # filter out IEO headers
-        res = re.match(r"^(Table|Figure) [A-Z]?(\d+|\d+\-\d+)\.", line)
+        res = self.header_regex.match(line)
         if res:
             return ""
         else:
@@ -476,22 +664,24 @@ class EIAAEOConverter(RoadmapPDFConverter):
             config = json.load(fp)
         super().__init__(custom_filter=self._custom_filter, **config)
 
+    header_regex = re.compile(r"^(Table|Figure) ([A-Z]+)?([\d\-]+)\.")
+
     def _custom_filter(self, line):
         # remove figure and table headers
-        res = re.match(r"^(Table|Figure) ([A-Z]+)?([\d\-]+)\.", line)
+        res = self.header_regex.match(line)
         if res:
             return ""
         else:
             return line
 
 
-def bulk_convert():
+def bulk_convert(page_chunk_size=PAGE_CHUNK_SIZE):
     eia_aeo = EIAAEOConverter()
     eia_ieo = EIAIEOConverter()
 
     processes = [
-        Process(target=eia_aeo.mp_parse_multiple_to_json),
-        Process(target=eia_ieo.mp_parse_multiple_to_json),
+        Process(target=eia_aeo.mp_parse_multiple_to_json, kwargs={"page_chunk_size": page_chunk_size}),
+        Process(target=eia_ieo.mp_parse_multiple_to_json, kwargs={"page_chunk_size": page_chunk_size}),
     ]
     for p in processes:
         p.start()
@@ -7,18 +7,26 @@ To run: python3 dataframe.py
 """
 
 from collections import Counter
+import hashlib
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
 import json
 import os
+from contextlib import contextmanager
+from functools import lru_cache
 from multiprocessing import Pool
 import re
 from time import time
-import spacy
-from spacy.tokens import DocBin
-from sklearn.feature_extraction.text import TfidfVectorizer, CountVectorizer
-from dtm_toolkit.preprocessing import Preprocessing
+from utils.dataset import write_dataset
+from utils.dedup import ParagraphIndex
+from utils.nlp import get_nlp
+# spacy, sklearn and dtm_toolkit are imported where they are used, so combining documents doesn't pay for them
 
 DOC_YEAR_MAP_PATH = "../static/corpora/doc_year_map.json"
+DOC_CACHE_DIR = "../static/corpora/.doc_cache"
+PAIR_COLUMNS = ["organisation", "doc_category", "filename",
+                "header_text", "para_text", "header_size", "para_size", "start_page"]
 NUM_CPU = os.cpu_count() - 1 if os.cpu_count() > 1 else 1
 
 
@@ -33,8 +41,218 @@ def remove_unserializable_results(doc):
                 setattr(token._, x, None)
         return doc
 
+def top_k_terms(tdm, feature_names, k):
+    """Highest scoring terms of each row of a sparse term-document matrix, working on the nonzeros of each row
+    only. Terms are ordered by descending score, ties by vocabulary order, i.e. the order a stable descending sort
+    over the whole vocabulary gives.
+
+    Args:
+        tdm (scipy.sparse.csr_matrix): term-document matrix, one row per paragraph
+        feature_names (np.ndarray): the term of each column of tdm
+        k (int): maximum number of terms per row
+
+    Returns:
+        list: one list of at most k terms per row
+    """
+    tdm = tdm.tocsr()
+    rows = []
+    for i in range(tdm.shape[0]):
+        start, end = tdm.indptr[i], tdm.indptr[i + 1]
+        data = tdm.data[start:end]
+        indices = tdm.indices[start:end]
+        nonzero = data != 0
+        data, indices = data[nonzero], indices[nonzero]
+        if len(data) > k:
+            # keep every score tied with the k-th highest so that ties are still broken by vocabulary order
+            kth = data[np.argpartition(-data, k - 1)[k - 1]]
+            candidates = data >= kth
+            data, indices = data[candidates], indices[candidates]
+        order = np.lexsort((indices, -data))[:k]
+        rows.append(feature_names[indices[order]].tolist())
+    return rows
+
+
+class DocCache:
+    """On-disk cache of spaCy parses keyed by a hash of the parsed text, so that re-running enrichment only parses
+    paragraphs that weren't parsed before. Parses are kept per model (name and version) and set of enabled pipeline
+    components, and are sharded into DocBin files by the first characters of the text hash, so only the shards the
+    texts at hand fall into are read and only the shards that gained parses are written.
+    """
+    shard_prefix = 2
+
+    def __init__(self, cache_dir, nlp, disable=()):
+        self.nlp = nlp
+        self.disable = list(disable)
+        pipes = [name for name in nlp.pipe_names if name not in self.disable]
+        model = f"{nlp.meta['lang']}_{nlp.meta['name']}-{nlp.meta['version']}"
+        pipes_key = hashlib.sha256(",".join(pipes).encode("utf-8")).hexdigest()[:8]
+        self.dir_path = os.path.join(cache_dir, f"{model}_{pipes_key}")
+
+    @staticmethod
+    def text_hash(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _shard_path(self, shard):
+        return os.path.join(self.dir_path, f"{shard}.spacy")
+
+    def _load_shard(self, shard):
+        path = self._shard_path(shard)
+        if not os.path.isfile(path):
+            return {}
+        from spacy.tokens import DocBin
+        doc_bin = DocBin(store_user_data=True).from_disk(path)
+        return {doc.user_data["text_hash"]: doc for doc in doc_bin.get_docs(self.nlp.vocab)}
+
+    def _save_shard(self, shard, docs):
+        os.makedirs(self.dir_path, exist_ok=True)
+        path = self._shard_path(shard)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        from spacy.tokens import DocBin
+        DocBin(store_user_data=True, docs=docs.values()).to_disk(tmp_path)
+        os.replace(tmp_path, path)
+
+    def pipe(self, texts, **kwargs):
+        """Drop-in for nlp.pipe. Texts that are not in the cache are parsed (once per distinct text) and added to it.
+
+        Args:
+            texts (iterable): texts to parse
+            **kwargs: passed on to nlp.pipe, e.g. n_process and batch_size
+
+        Yields:
+            spacy.tokens.Doc: the parse of each text, in order
+        """
+        texts = list(texts)
+        hashes = [self.text_hash(text) for text in texts]
+        shards = {}
+        missing = {}
+        for text, h in zip(texts, hashes):
+            shard = h[:self.shard_prefix]
+            if shard not in shards:
+                shards[shard] = self._load_shard(shard)
+            if h not in shards[shard]:
+                missing.setdefault(h, text)
+        print(f"parsing {len(missing)} of {len(hashes)} texts, the rest are cached in {self.dir_path} or repeated")
+        if missing:
+            for h, doc in zip(missing, self.nlp.pipe(missing.values(), disable=self.disable, **kwargs)):
+                remove_unserializable_results(doc)
+                doc.user_data["text_hash"] = h
+                shards[h[:self.shard_prefix]][h] = doc
+            for shard in {h[:self.shard_prefix] for h in missing}:
+                self._save_shard(shard, shards[shard])
+        for h in hashes:
+            yield shards[h[:self.shard_prefix]][h]
+
+
+def _capture_token_attrs(docs, token_attrs):
+    """Passes a stream of spaCy Docs through unchanged, appending the (lower, lemma, pos) of the tokens of each Doc
+    to token_attrs, so that lemmas and pos tags can be read without parsing the text again.
+    """
+    for doc in docs:
+        token_attrs.append([(tok.lower_, tok.lemma_, tok.pos_) for tok in doc])
+        yield doc
+
+
+def align_lemm_pos(filt_text, token_attrs):
+    """Looks up the (lemma, pos) of each token of a filtered paragraph in the tokens of the parsed paragraph it
+    was filtered from. Filtering only drops tokens, so each filtered token is matched (by its lower case form or
+    its lemma) against the parsed tokens in order.
+
+    Args:
+        filt_text (str): whitespace separated filtered tokens of the paragraph
+        token_attrs (list): (lower, lemma, pos) of each token of the parsed paragraph
+
+    Returns:
+        list: (lemma, pos) of each filtered token, or None if a token could not be matched
+    """
+    rows = []
+    i = 0
+    for tok in filt_text.split():
+        tok = tok.lower()
+        while i < len(token_attrs) and tok != token_attrs[i][0] and tok != token_attrs[i][1].lower():
+            i += 1
+        if i == len(token_attrs):
+            return None
+        rows.append(token_attrs[i][1:])
+        i += 1
+    return rows
+
+
+_TFIDF_FEATURE_NAMES = None
+
+
+def _init_tfidf_worker(feature_names):
+    global _TFIDF_FEATURE_NAMES
+    _TFIDF_FEATURE_NAMES = feature_names
+
+
+def _top_k_terms_worker(args):
+    tdm_chunk, k = args
+    return top_k_terms(tdm_chunk, _TFIDF_FEATURE_NAMES, k)
+
+
+@lru_cache(maxsize=None)
+def load_doc_year_map(mapping_path=DOC_YEAR_MAP_PATH):
+    """Reads the filename -> year mapping once per process.
+    """
+    with open(mapping_path, "r") as fp:
+        return {file_: int(year) for file_, year in json.load(fp).items()}
+
+
+@contextmanager
+def worker_pool(processes=NUM_CPU):
+    """Process pool that is always shut down on leaving the with block, also when the caller stops consuming results
+    early or raises (e.g. an interrupted notebook cell), so no worker processes are leaked.
+    """
+    pool = Pool(processes)
+    try:
+        yield pool
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def _imap_largest_first(pool, fn, files, processes=NUM_CPU):
+    """Maps fn over files in the pool, largest file first so the long documents don't end up last on a single worker,
+    in chunks of several files per task to cut down on dispatch overhead. Results come back in completion order.
+
+    The size sorted files are dealt out over the chunks (chunk i takes every n_chunks-th file from the i-th on), so each
+    chunk gets one of the largest files rather than the first chunk getting all of them.
+    """
+    files = sorted(files, key=os.path.getsize, reverse=True)
+    chunksize = max(1, len(files) // (4 * processes))
+    n_chunks = -(-len(files) // chunksize)
+    chunks = [(fn, files[i::n_chunks]) for i in range(n_chunks)]
+    return (result for results in pool.imap_unordered(_map_chunk, chunks) for result in results)
+
+
+def _map_chunk(task):
+    fn, files = task
+    return [fn(path) for path in files]
+
+
+def _combine_doc_worker(file_path):
+    return file_path, DataFrameCreator.combine_doc(file_path)
+
+
+def _combine_doc_batch_worker(file_path):
+    """Header paragraph pairs of a document as a dataframe batch, see DataFrameCreator.iter_combined.
+    """
+    paired_data = DataFrameCreator.combine_doc(file_path)
+    if not paired_data:
+        return file_path, None
+    org, category, fn = paired_data[0][:3]
+    batch = pd.DataFrame([pair[3:] for pair in paired_data], columns=PAIR_COLUMNS[3:])
+    for col, value in zip(PAIR_COLUMNS[:3], (org, category, fn)):
+        # a single category per document rather than the string repeated on every row
+        batch[col] = pd.Categorical.from_codes(np.zeros(len(batch), dtype=np.int8), categories=[value])
+    return file_path, batch
+
+
 class DataFrameCreator:
-    def __init__(self, dirs, save_path="corpus_df.csv"):
+    def __init__(self, dirs, save_path="corpus_df.csv", doc_cache_dir=DOC_CACHE_DIR):
         if isinstance(dirs, list):
             self.dirs = dirs
         elif isinstance(dirs, str):
@@ -46,71 +264,171 @@ class DataFrameCreator:
         self.files = self._get_files()
         print("=============")
         print(f"Found {len(self.files)} files.")
-        self.nlp = spacy.load("en_core_web_sm")
-        self.nlp.add_pipe('sentencizer')
-        self.columns = ["organisation", "doc_category", "filename",
-                        "header_text", "para_text", "header_size", "para_size", "start_page"]
+        self.columns = list(PAIR_COLUMNS)
         self.save_path = save_path
+        # parses of para_text are cached here across runs, None to always parse
+        self.doc_cache_dir = doc_cache_dir
 
-    def run(self, type_="csv", tfidf=True, lemm_pos=True, save=True):
+    @property
+    def nlp(self):
+        # loaded on first use, combining documents doesn't need it
+        return get_nlp(sentencizer=True)
+
+    def run(self, type_="csv", tfidf=True, lemm_pos=True, save=True, enrich=True, drop_unmapped=True, min_para_chars=0,
+            max_para_chars=None, drop_duplicates=True, near_dup_clusters=None):
         """This function runs the dataframe creator. It combines the content of the structured json files into header-paragraph pairs,
         and places them into a dataframe. There are also optional enrichment steps that are executed on the raw data
         in order to create more useful columns for analysis further down the pipeline.
 
         Args:
-            type_ (str, optional): This is the save type of the dataframe. Defaults to "csv".
+            type_ (str, optional): This is the save type of the dataframe, one of "csv", "pickle" or "parquet". "parquet" writes
+                a dataset partitioned by doc_category and year to the save_path directory, see utils/dataset.py. Defaults to "csv".
             tfidf (bool, optional): Whether or not to enrich the dataframe with a tfidf representation of each paragraph. Defaults to True.
             lemm_pos (bool, optional): Whether or not to enrich the dataframe with a lemmatised and pos tagged representation of each paragraph. 
                 NOTE takes a significant amount of time to run. Defaults to True.
+            enrich (bool, optional): Whether to run the enrichment at all, including the filtered header and paragraph columns.
+                If False no spaCy model is loaded. Defaults to True.
+            drop_unmapped (bool, optional): Whether to drop the rows of files without a year in the doc year map, before enrichment.
+                Defaults to True.
+            min_para_chars (int, optional): rows with shorter paragraphs are dropped before enrichment. Defaults to 0.
+            max_para_chars (int, optional): rows with longer paragraphs are dropped before enrichment. Defaults to None, no limit.
+            drop_duplicates (bool, optional): Whether to drop repeats of a paragraph within the same file. Defaults to True.
+            near_dup_clusters (bool, optional): Whether to add the near_dup_cluster column (MinHash near duplicate clusters
+                of the paragraphs, see utils/dedup.py). Defaults to None, only when enriching.
         """
-        # combine text into header-paragraph pairs
+        # combine text into header-paragraph pairs, straight into a dataframe
         print("combining...")
-        data = self.combine()
-        # create initial data frame with the combined information
-        print("creating dataframe...")
-        df = pd.DataFrame(data=data, columns=self.columns)
-        df = df.dropna(subset=['para_text'])
-        print("enriching...")
-        df = self._enrich(df, tfidf=tfidf, lemm_pos=lemm_pos)
-        df = self.annotate_year(DOC_YEAR_MAP_PATH, df) 
+        df = self.combine_frame()
+        # the year is attached straight away so rows that will be dropped for lack of one are never enriched
+        df = self.annotate_year(DOC_YEAR_MAP_PATH, df)
+        df = self._prefilter(df, drop_unmapped=drop_unmapped, min_para_chars=min_para_chars, max_para_chars=max_para_chars,
+                             drop_duplicates=drop_duplicates)
+        if near_dup_clusters is None:
+            near_dup_clusters = enrich
+        para_index = None
+        if enrich or near_dup_clusters:
+            # exact duplicates are enriched once, the MinHash clustering only runs when its column is wanted
+            para_index = ParagraphIndex(df['para_text'].to_list(), near_duplicates=near_dup_clusters)
+            para_index.report()
+        if near_dup_clusters:
+            df['near_dup_cluster'] = para_index.clusters
+        if enrich:
+            print("enriching...")
+            df = self._enrich(df, tfidf=tfidf, lemm_pos=lemm_pos, para_index=para_index)
         if save:
             if type_ == "csv":
                 df.to_csv(self.save_path, index=False)
+            elif type_ == "parquet":
+                write_dataset(df, self.save_path)
             else:
                 df.to_pickle(self.save_path)
         return df
 
-    def combine(self):
+    def _prefilter(self, df, drop_unmapped=True, min_para_chars=0, max_para_chars=None, drop_duplicates=True):
+        """Applies every row level exclusion before any spaCy or tf-idf work is done, reporting the rows removed by each.
+
+        Returns:
+            pd.DataFrame: the remaining rows
+        """
+        print(f"prefiltering {len(df)} rows...")
+        para_len = df['para_text'].str.strip().str.len()
+        steps = [
+            # header only pairs
+            ("no paragraph", lambda df: df['para_text'].notna()),
+            ("empty paragraph", lambda df: para_len[df.index] > 0),
+        ]
+        if drop_unmapped:
+            steps.append(("no year", lambda df: df['year'].notna()))
+        if min_para_chars:
+            steps.append((f"paragraph under {min_para_chars} characters", lambda df: para_len[df.index] >= min_para_chars))
+        if max_para_chars is not None:
+            steps.append((f"paragraph over {max_para_chars} characters", lambda df: para_len[df.index] <= max_para_chars))
+        if drop_duplicates:
+            steps.append(("duplicate paragraph in file", lambda df: ~df.duplicated(subset=['filename', 'para_text'])))
+        for name, keep in steps:
+            n = len(df)
+            df = df[keep(df)]
+            print(f"-- {name}: removed {n - len(df)} rows")
+        print(f"{len(df)} rows left to enrich.")
+        return df
+
+    def combine(self, pool=None):
         """Merges all the documents into header paragraph pairs and creates a dataframe
+
+        Args:
+            pool (multiprocessing.Pool, optional): pool to reuse. Defaults to None, a pool is created and shut down here.
         """
+        if pool is None:
+            with worker_pool() as pool:
+                return self.combine(pool)
+        results = dict(_imap_largest_first(pool, _combine_doc_worker, self.files))
         combined = []
-        pool = Pool(NUM_CPU)
-        a = [pool.apply_async(self.combine_doc, args=(path,))
-             for path in self.files]
-        for fut in a:
-            res = fut.get()
-            if res:
-                combined.extend(res)
+        for path in self.files:
+            if results[path]:
+                combined.extend(results[path])
         print(f"Found {len(combined)} header-paragraph pairings in the corpus.")
         return combined
 
+    def iter_combined(self, pool=None):
+        """Streams the header paragraph pairs of the corpus one document at a time, so that consumers only hold a single
+        document's pairs in memory. Documents are yielded in the order the workers finish them.
+
+        Args:
+            pool (multiprocessing.Pool, optional): pool to reuse. Defaults to None, a pool is created and shut down here.
+
+        Yields:
+            tuple: (index of the document in self.files, pd.DataFrame of its pairs with the columns of self.columns)
+        """
+        if pool is None:
+            with worker_pool() as pool:
+                yield from self.iter_combined(pool)
+            return
+        index = {path: i for i, path in enumerate(self.files)}
+        for path, batch in _imap_largest_first(pool, _combine_doc_batch_worker, self.files):
+            if batch is not None:
+                yield index[path], batch
+
+    def combine_frame(self, pool=None):
+        """Merges all the documents into header paragraph pairs and creates a dataframe from the per document batches of
+        iter_combined, in the order of self.files. organisation, doc_category and filename are categoricals.
+        """
+        batches = [batch for _, batch in sorted(self.iter_combined(pool), key=lambda x: x[0])]
+        if not batches:
+            return pd.DataFrame(columns=self.columns)
+        categorical_cols = self.columns[:3]
+        df = pd.concat([batch.drop(columns=categorical_cols) for batch in batches], ignore_index=True)
+        for col in categorical_cols:
+            df[col] = union_categoricals([batch[col] for batch in batches])
+        for col in ("header_size", "para_size", "start_page"):
+            # a document whose pairs all lack e.g. a header size gives an object column, as one big frame would have
+            # been, the sizes are floats (or ints if never missing)
+            df[col] = df[col].infer_objects()
+        print(f"Found {len(df)} header-paragraph pairings in the corpus.")
+        return df[self.columns]
+
     @classmethod
     def annotate_year(self, mapping_path, df):
-        with open(mapping_path, "r") as fp:
-            mapping = json.load(fp)
-        years = []
-        null_counter = 0
-        for file_ in df['filename']:
-            if file_ not in mapping:
-                null_counter += 1
-                years.append(None)
-            else:
-                years.append(int(mapping[file_]))
-        df['year'] = years
+        """Adds the year of each row's file as the year column, NaN for files missing from the mapping, which are reported.
+        The mapping is looked up once per file (category of the filename column) rather than once per row.
+        """
+        mapping = load_doc_year_map(mapping_path)
+        filenames = df['filename'].astype("category")
+        categories = filenames.cat.categories
+        year_by_code = np.array([mapping.get(file_, np.nan) for file_ in categories], dtype=float)
+        codes = filenames.cat.codes.to_numpy()
+        years = np.where(codes >= 0, year_by_code[codes], np.nan)
+        unmapped = [file_ for file_, year in zip(categories, year_by_code) if np.isnan(year)]
+        if unmapped:
+            counts = filenames.value_counts()
+            print(f"{int(counts[unmapped].sum())} rows from {len(unmapped)} files have no year in {mapping_path}:")
+            for file_ in unmapped:
+                print(f"-- {file_} ({counts[file_]} rows)")
+        # ints as before if every row has a year
+        df['year'] = years.astype(int) if not np.isnan(years).any() else years
         return df
 
 
-    def _enrich(self, df, tfidf=True, lemm_pos=True):
+    def _enrich(self, df, tfidf=True, lemm_pos=True, para_index=None):
         """This function enriches the dataframes representation of each paragraph by adding columns such as: 
         1. The highest ranking tfidf words from each paragraph based on the whole dataframe corpus. 
         2. Spacy document object that can be used for pos tags, dependency parsing etc.
@@ -124,13 +442,33 @@ class DataFrameCreator:
 
         Args:
             df (pd.DataFrame): the dataframe that holds the raw paragraph data.
+            para_index (ParagraphIndex, optional): duplicate index of df's para_text, built here if None.
 
         Returns:
             df (pd.DataFrame): the dataframe that now holds the raw and enriched paragraph data.
         """
+        from dtm_toolkit.preprocessing import Preprocessing
         df = df.dropna(subset=['para_text'])
+        # each text column is parsed once with the full pipeline. The parser stays on: it sets the sentence boundaries
+        # (the sentencizer doesn't overwrite them) and the dependencies and noun chunks Preprocessing gets
         header_preprocessor = Preprocessing(self.nlp.pipe(df['header_text'], n_process=NUM_CPU, batch_size=256))
-        para_preprocessor = Preprocessing(self.nlp.pipe(df['para_text'], n_process=NUM_CPU, batch_size=256))
+        # paragraphs repeated across the corpus are only parsed once, their Doc is shared by every occurrence
+        if para_index is None or len(para_index.inverse) != len(df):
+            para_index = ParagraphIndex(df['para_text'].to_list(), near_duplicates=False)
+        if self.doc_cache_dir:
+            unique_docs = DocCache(self.doc_cache_dir, self.nlp).pipe(
+                para_index.unique_texts, n_process=NUM_CPU, batch_size=256)
+        else:
+            unique_docs = self.nlp.pipe(para_index.unique_texts, n_process=NUM_CPU, batch_size=256)
+        token_attrs = None
+        if lemm_pos:
+            # lemmas and pos tags are read off the same Docs as the filtered paragraphs
+            token_attrs = []
+            unique_docs = _capture_token_attrs(unique_docs, token_attrs)
+        unique_docs = list(unique_docs)
+        if token_attrs is not None:
+            token_attrs = para_index.expand(token_attrs)
+        para_preprocessor = Preprocessing(para_index.expand(unique_docs))
         # simple tokenisation, no n-grams
         header_preprocessor.preprocess(ngrams=False)
         para_preprocessor.preprocess(ngrams=False)
@@ -139,9 +477,9 @@ class DataFrameCreator:
         df['filt_header_text'] = filtered_headers.fillna("").to_list()
         df['filt_para_text'] = filtered_paras.fillna("").to_list()
         if tfidf or lemm_pos:
-            self.enricher = Enricher()
+            self.enricher = Enricher(nlp=self.nlp)
             if lemm_pos:
-                df = self.enricher.get_lemm_pos_para_text(df)
+                df = self.enricher.get_lemm_pos_para_text(df, token_attrs)
             if tfidf:
                 df = self.enricher.get_tfidf(df)
         return df
@@ -155,7 +493,8 @@ class DataFrameCreator:
             files.extend(dir_files)
         return files
 
-    def combine_doc(self, file_path):
+    @staticmethod
+    def combine_doc(file_path):
         """Merges a single document into header-paragraph pairs by:
             1. Checking to see if the current chunk is a heading
             2. If it is, then it gets a new entry in the accumulator list
@@ -175,10 +514,10 @@ class DataFrameCreator:
         if len(data) == 1 and data[0] == {}:
             return None
         else:
-            std_font_size = self._get_para_font_size(data)
+            std_font_size = DataFrameCreator._get_para_font_size(data)
         for i in range(len(data)):
             el = data[i]
-            el_is_heading = self._is_heading(el['size'], std_font_size)
+            el_is_heading = DataFrameCreator._is_heading(el['size'], std_font_size)
             # edge case at end of data array
             if i == len(data) - 1:
                 if el_is_heading:
@@ -187,7 +526,7 @@ class DataFrameCreator:
                 # else do nothing; the final paragraph element should have been picked up by the previous heading
             else:
                 next_el = data[i+1]
-                next_el_is_heading = self._is_heading(
+                next_el_is_heading = DataFrameCreator._is_heading(
                     next_el['size'], std_font_size)
                 if el_is_heading and next_el_is_heading:
                     # then there is no paragraph text for the current element
@@ -202,13 +541,15 @@ class DataFrameCreator:
                         [org, category, fn, None, next_el['text'], None, next_el['size'], next_el['page']])
         return paired_data
 
-    def _get_para_font_size(self, doc):
+    @staticmethod
+    def _get_para_font_size(doc):
         acc = Counter()
         for el in doc:
             acc[el['size']] += len(el['text'])
         return acc.most_common(1)[0][0]
 
-    def _is_heading(self, size, std_font_size):
+    @staticmethod
+    def _is_heading(size, std_font_size):
         if size > std_font_size:
             return True
         else:
@@ -231,36 +572,75 @@ class DataFrameCreator:
 
 
 class Enricher:
-    def __init__(self, tfidf_max_lim=100):
-        self.nlp = spacy.load("en_core_web_sm")
+    def __init__(self, tfidf_max_lim=100, nlp=None):
+        # share the pipeline of the DataFrameCreator where there is one rather than loading a second copy
+        self._nlp = nlp
         self.tfidf_max_lim = tfidf_max_lim
 
-    def get_tfidf(self, df):
+    @property
+    def nlp(self):
+        if self._nlp is None:
+            self._nlp = get_nlp()
+        return self._nlp
+
+    def get_tfidf(self, df, n_process=1, chunk_size=4096):
         """ Gets a list of the highest value tfidfs from the corpus for each row and returns these values with their pos tags.
 
         Args:
-            df ([type]): [description]
+            df (pd.DataFrame): dataframe with a filt_para_text column
+            n_process (int, optional): number of processes the top terms are extracted with, the rows of the
+                term-document matrix are split into chunks of chunk_size rows. Defaults to 1.
+            chunk_size (int, optional): rows per chunk when n_process > 1. Defaults to 4096.
         """
-        v = TfidfVectorizer()
-        tdm = v.fit_transform(df['filt_para_text'].to_list())
-        doc_tfidfs = []
-        for i, doc in enumerate(tdm):
-            sorted_terms = [g for g, v in sorted(zip(list(v.get_feature_names(
-            )), doc.todense().tolist()[0]), key=lambda x: x[1], reverse=True) if v != 0]
-            terms = sorted_terms[:self.tfidf_max_lim]
-            doc_tfidfs.append(terms)
-        df['para_tfidf'] = doc_tfidfs
+        from sklearn.feature_extraction.text import CountVectorizer
+        from sklearn.preprocessing import normalize
+        texts = df['filt_para_text'].to_list()
+        # each distinct paragraph is only vectorised once, the document frequencies are weighted by the number of
+        # times it occurs so that the idf (and so every score) is that of TfidfVectorizer over all the rows
+        ids = {}
+        inverse = np.fromiter((ids.setdefault(text, len(ids)) for text in texts), dtype=np.int64, count=len(texts))
+        multiplicity = np.bincount(inverse, minlength=len(ids))
+        v = CountVectorizer()
+        tdm = v.fit_transform(list(ids)).tocsr().astype(np.float64)
+        rows = np.repeat(np.arange(tdm.shape[0]), np.diff(tdm.indptr))
+        doc_freq = np.bincount(tdm.indices, weights=multiplicity[rows], minlength=tdm.shape[1])
+        # smooth_idf as in TfidfTransformer
+        idf = np.log((len(texts) + 1) / (doc_freq + 1)) + 1
+        tdm.data *= idf[tdm.indices]
+        tdm = normalize(tdm, norm="l2", copy=False)
+        # the vocabulary is only built once, rather than once per row
+        feature_names = v.get_feature_names_out()
+        if n_process > 1 and tdm.shape[0] > chunk_size:
+            chunks = [(tdm[i:i + chunk_size], self.tfidf_max_lim) for i in range(0, tdm.shape[0], chunk_size)]
+            with Pool(n_process, initializer=_init_tfidf_worker, initargs=(feature_names,)) as pool:
+                doc_tfidfs = [terms for chunk in pool.map(_top_k_terms_worker, chunks) for terms in chunk]
+        else:
+            doc_tfidfs = top_k_terms(tdm, feature_names, self.tfidf_max_lim)
+        df['para_tfidf'] = [doc_tfidfs[i] for i in inverse]
         return df
 
-    def get_lemm_pos_para_text(self, df):
-        rows = []
-        docs = self.nlp.pipe(df.filt_para_text, n_process=NUM_CPU, batch_size=256)
-        for doc in docs:
-            lem_pos_row = []
-            for tok in doc:
-                lem_pos_row.append((tok.lemma_, tok.pos_))
-            rows.append(lem_pos_row)
-        df['lemm_pos_filt_para_text'] = pd.Series(rows)
+    def get_lemm_pos_para_text(self, df, token_attrs=None):
+        """Adds the (lemma, pos) of each token of filt_para_text as the lemm_pos_filt_para_text column.
+
+        Args:
+            df (pd.DataFrame): dataframe with a filt_para_text column
+            token_attrs (list, optional): (lower, lemma, pos) of the tokens of each parsed para_text, in row order,
+                see _capture_token_attrs. Rows whose filtered tokens can't be aligned with them, or all rows if None,
+                are parsed here with only the components needed for lemmas and pos tags.
+        """
+        texts = df.filt_para_text.to_list()
+        if token_attrs is not None and len(token_attrs) == len(texts):
+            rows = [align_lemm_pos(text, attrs) for text, attrs in zip(texts, token_attrs)]
+        else:
+            rows = [None] * len(texts)
+        missing = [i for i, row in enumerate(rows) if row is None]
+        if missing:
+            docs = self.nlp.pipe([texts[i] for i in missing], disable=["parser", "ner", "sentencizer"],
+                                 n_process=NUM_CPU, batch_size=256)
+            for i, doc in zip(missing, docs):
+                rows[i] = [(tok.lemma_, tok.pos_) for tok in doc]
+        # a list rather than a pd.Series, which would be aligned on the index and misplace rows after dropna
+        df['lemm_pos_filt_para_text'] = rows
         return df
 
 
@@ -1,16 +1,133 @@
-import spacy
-from spacy.matcher import PhraseMatcher
 import numpy as np
 import pandas as pd
 import os
+import hashlib
+from scipy import sparse
+import sys
 from collections import Counter, defaultdict
-from sklearn.metrics.pairwise import cosine_similarity
 import re
 import json
-from dtm_toolkit.auto_labelling import AutoLabel
+import pickle
+# spacy, sklearn and dtm_toolkit are imported where they are used
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from utils.nlp import get_nlp
+from utils.union_find import DisjointSet
+from similarity import SimilarityIndex, DEFAULT_MAX_MEMORY
 
 EUROVOC_PATH = "../../static/eurovoc/eurovoc_export_en.csv"
 WHITELIST_EUROVOC_LABELS_PATH = "../../static/eurovoc/eurovoc_final_labels.txt"
+EMBEDDING_CACHE_DIR = "../../static/eurovoc/.embedding_cache"
+THESAURUS_CACHE_DIR = "../../static/eurovoc/.thesaurus_cache"
+# identifies the model (and configuration) AutoLabel embeds phrases with, the phrase embedding cache is keyed on it and
+# on the dtm_toolkit version. Change it, or pass embedding_model to merge_labels, whenever AutoLabel's model changes
+EMBEDDING_MODEL = "dtm_toolkit.auto_labelling:default"
+# phrases embedded again and compared with their cached vectors when the cache is asked to verify the model
+EMBEDDING_PROBE_PHRASES = ["energy", "renewable energy", "crude oil price", "european union law"]
+
+def _package_version(name):
+    from importlib import metadata
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return None
+
+class PhraseEmbeddingCache:
+    """On-disk cache of phrase embeddings, one per embedding model. The matrix is a .npy file opened memory mapped, with
+    the phrase of each row and the key of the model (the embedding_model identifier and the dtm_toolkit version) in a
+    json file alongside it. Phrases are only ever embedded once, new phrases are embedded (through AutoLabel, each phrase
+    as its own label) and appended to the matrix, so a session with every phrase cached doesn't load AutoLabel at all.
+
+    Args:
+        cache_dir (str, optional): directory of the cache. Defaults to EMBEDDING_CACHE_DIR.
+        embedding_model (str, optional): identifier of AutoLabel's embedding model. Defaults to EMBEDDING_MODEL.
+        verify_model (bool, optional): embed EMBEDDING_PROBE_PHRASES again and discard the cache if their vectors no longer
+            match the cached ones, which catches a model change the identifier missed. Loads AutoLabel's model. Defaults to False.
+    """
+
+    def __init__(self, cache_dir=EMBEDDING_CACHE_DIR, embedding_model=EMBEDDING_MODEL, verify_model=False):
+        self.model = {"embedding_model": embedding_model, "dtm_toolkit": _package_version("dtm_toolkit")}
+        key = hashlib.sha256(json.dumps(self.model, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        self.matrix_path = os.path.join(cache_dir, f"{key}.npy")
+        self.phrases_path = os.path.join(cache_dir, f"{key}.json")
+        self.verify_model = verify_model
+
+    @staticmethod
+    def _embed(phrases):
+        from dtm_toolkit.auto_labelling import AutoLabel
+        al = AutoLabel(pd.DataFrame({"phrase": phrases, "label": phrases}), phrase_col="phrase", label_col="label")
+        al._init_embeddings()
+        embeddings = dict(zip(al.sorted_labels, al.phrase_embeddings))
+        return np.array([np.asarray(embeddings[phrase][0]) for phrase in phrases])
+
+    def _load(self):
+        if not (os.path.isfile(self.matrix_path) and os.path.isfile(self.phrases_path)):
+            return [], None
+        with open(self.phrases_path, "r") as fp:
+            cached = json.load(fp)
+        if cached.get("model") != self.model:
+            print(f"{self.matrix_path} was written for another embedding model, embedding every phrase again...")
+            return [], None
+        phrases = cached["phrases"]
+        matrix = np.load(self.matrix_path, mmap_mode="r")
+        if matrix.shape[0] != len(phrases):
+            # interrupted write, start over
+            return [], None
+        return phrases, matrix
+
+    def _save(self, phrases, matrix):
+        os.makedirs(os.path.dirname(self.matrix_path), exist_ok=True)
+        tmp_path = f"{self.matrix_path}.{os.getpid()}.tmp.npy"
+        np.save(tmp_path, matrix)
+        os.replace(tmp_path, self.matrix_path)
+        tmp_path = f"{self.phrases_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as fp:
+            json.dump({"model": self.model, "phrases": phrases}, fp)
+        os.replace(tmp_path, self.phrases_path)
+
+    def _verify(self, cached, matrix):
+        """Checks the cached vectors of the probe phrases against freshly embedded ones.
+
+        Returns:
+            list, np.array, dict: the cache (emptied on a mismatch) and the fresh vectors of the probe phrases
+        """
+        probe = dict(zip(EMBEDDING_PROBE_PHRASES, self._embed(EMBEDDING_PROBE_PHRASES)))
+        rows = {phrase: i for i, phrase in enumerate(cached)}
+        for phrase, vector in probe.items():
+            if phrase in rows and not np.allclose(np.asarray(matrix[rows[phrase]]), vector, rtol=1e-4, atol=1e-6):
+                print(f"the vectors in {self.matrix_path} don't match the embedding model, embedding every phrase again...")
+                return [], None, probe
+        return cached, matrix, probe
+
+    def get(self, phrases):
+        """Embeds phrases, only embedding the ones that aren't cached yet.
+
+        Args:
+            phrases (iterable): phrases to embed
+
+        Returns:
+            np.array, np.array: the (memory mapped) embedding matrix and the row of each phrase in it
+        """
+        phrases = list(phrases)
+        cached, matrix = self._load()
+        probe = {}
+        if self.verify_model:
+            cached, matrix, probe = self._verify(cached, matrix)
+        rows = {phrase: i for i, phrase in enumerate(cached)}
+        # the probe phrases are stored as well, so the next verification has cached vectors to compare with
+        missing = list(dict.fromkeys(phrase for phrase in phrases + list(probe) if phrase not in rows))
+        if missing:
+            to_embed = [phrase for phrase in missing if phrase not in probe]
+            if to_embed:
+                print(f"embedding {len(to_embed)} phrases not in {self.matrix_path}...")
+            embedded = dict(zip(to_embed, self._embed(to_embed))) if to_embed else {}
+            embedded = np.array([probe[phrase] if phrase in probe else embedded[phrase] for phrase in missing])
+            matrix = embedded if matrix is None else np.concatenate([np.asarray(matrix), embedded.astype(matrix.dtype)])
+            cached = cached + missing
+            self._save(cached, matrix)
+            cached, matrix = self._load()
+            rows = {phrase: i for i, phrase in enumerate(cached)}
+        return matrix, np.array([rows[phrase] for phrase in phrases], dtype=np.int64)
 
 class Eurovoc:
 
@@ -32,9 +149,33 @@ class Eurovoc:
         "2026 consumption": "2016 business operations and trade",
     }
 
-    def __init__(self, eurovoc_path=None, eurovoc_whitelist=False, whitelist_eurovoc_labels=None):
-        self.nlp = spacy.load("en_core_web_sm")
+    def __init__(self, eurovoc_path=None, eurovoc_whitelist=False, whitelist_eurovoc_labels=None, cache_dir=THESAURUS_CACHE_DIR):
+        """Loads the thesaurus from its compiled artifact (see _load_thesaurus), only reading and preprocessing the csv
+        when the csv, the whitelist or the label maps changed since it was compiled.
+
+        Attributes:
+            eurovoc (pd.DataFrame): the thesaurus, one row per term, with the preprocessed MT label of each
+            labels (np.array): the distinct MT labels, sorted
+            label_codes (np.array): for each row of eurovoc, the index of its MT in labels
+            label_offsets (np.array): the rows of the terms of labels[i] are term_rows[label_offsets[i]:label_offsets[i + 1]]
+            term_rows (np.array): rows of eurovoc grouped by label
+            term_labels (dict): term -> tuple of the indices (in labels) of the labels it belongs to
+        """
         print("Initialising EuroVoc...")
+        eurovoc_path = eurovoc_path if isinstance(eurovoc_path, str) else EUROVOC_PATH
+        whitelist = None
+        if eurovoc_whitelist:
+            self.whitelist_eurovoc_labels = whitelist_eurovoc_labels if whitelist_eurovoc_labels != None else [x.strip().lower() for x in open(WHITELIST_EUROVOC_LABELS_PATH, "r").readlines()]
+            whitelist = self.whitelist_eurovoc_labels
+        thesaurus = self._load_thesaurus(eurovoc_path, whitelist, cache_dir)
+        self.eurovoc = thesaurus["eurovoc"]
+        self.labels = thesaurus["labels"]
+        self.label_codes = thesaurus["label_codes"]
+        self.label_offsets = thesaurus["label_offsets"]
+        self.term_rows = thesaurus["term_rows"]
+        self.term_labels = thesaurus["term_labels"]
+
+    def _compile_thesaurus(self, eurovoc_path, whitelist):
         def preproc(label):
             lowered_label = label.lower()
             if lowered_label in self.eurovoc_label_remapping:
@@ -42,26 +183,100 @@ class Eurovoc:
             if lowered_label in self.eurovoc_label_correction_map:
                 lowered_label = self.eurovoc_label_correction_map[lowered_label]
             return lowered_label
-        self.eurovoc = pd.read_csv(EUROVOC_PATH) if not isinstance(eurovoc_path, str) else pd.read_csv(eurovoc_path)
-        self.eurovoc['MT'] = self.eurovoc['MT'].apply(preproc)
-        if eurovoc_whitelist:
-            self.whitelist_eurovoc_labels = whitelist_eurovoc_labels if whitelist_eurovoc_labels != None else [x.strip().lower() for x in open(WHITELIST_EUROVOC_LABELS_PATH, "r").readlines()]
-            m = self.eurovoc.apply(lambda x: x.MT.lower() in self.whitelist_eurovoc_labels, axis=1)
-            self.eurovoc = self.eurovoc[m]
-            assert len(self.eurovoc['MT'].drop_duplicates()) == len(self.whitelist_eurovoc_labels)
-        self.eurovoc['index'] = [i for i in range(len(self.eurovoc))]
-        self.eurovoc = self.eurovoc.set_index('index')
-    
-    def _init_embeddings(self):
+        eurovoc = pd.read_csv(eurovoc_path)
+        # preprocess each distinct label once
+        codes, uniques = pd.factorize(eurovoc['MT'])
+        eurovoc['MT'] = np.array([preproc(label) for label in uniques], dtype=object)[codes]
+        if whitelist is not None:
+            eurovoc = eurovoc[eurovoc['MT'].str.lower().isin(set(whitelist))]
+            assert len(eurovoc['MT'].drop_duplicates()) == len(whitelist)
+        eurovoc = eurovoc.reset_index(drop=True)
+        eurovoc.index.name = 'index'
+        label_codes, labels = pd.factorize(eurovoc['MT'], sort=True)
+        term_rows = np.argsort(label_codes, kind="stable")
+        label_offsets = np.r_[0, np.cumsum(np.bincount(label_codes, minlength=len(labels)))]
+        term_labels = defaultdict(set)
+        for term, code in zip(eurovoc['TERMS (PT-NPT)'].astype(str), label_codes):
+            term_labels[term].add(int(code))
+        return {
+            "eurovoc": eurovoc,
+            "labels": np.asarray(labels, dtype=object),
+            "label_codes": label_codes,
+            "label_offsets": label_offsets,
+            "term_rows": term_rows,
+            "term_labels": {term: tuple(sorted(codes)) for term, codes in term_labels.items()},
+        }
+
+    def _load_thesaurus(self, eurovoc_path, whitelist, cache_dir):
+        """Compiled thesaurus, cached in a pickle keyed by the hashes of the csv, the whitelist and the label maps, and by
+        the pandas version the frame was pickled with. A pickle that can't be loaded is compiled again.
+        """
+        key = hashlib.sha256()
+        with open(eurovoc_path, "rb") as fp:
+            key.update(fp.read())
+        key.update(json.dumps([whitelist, self.eurovoc_label_remapping, self.eurovoc_label_correction_map, pd.__version__],
+                              sort_keys=True).encode("utf-8"))
+        path = os.path.join(cache_dir, f"{key.hexdigest()[:16]}.pickle")
+        if os.path.isfile(path):
+            try:
+                with open(path, "rb") as fp:
+                    return pickle.load(fp)
+            except Exception as e:
+                # truncated, or written by versions of pandas/numpy this one can't read
+                print(f"couldn't load {path} ({e!r}), compiling the thesaurus again...")
+        thesaurus = self._compile_thesaurus(eurovoc_path, whitelist)
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as fp:
+            pickle.dump(thesaurus, fp, protocol=4)
+        os.replace(tmp_path, path)
+        return thesaurus
+
+    def label_terms(self, label):
+        """The terms of a (preprocessed) MT label.
+        """
+        i = np.searchsorted(self.labels, label)
+        if i == len(self.labels) or self.labels[i] != label:
+            return []
+        rows = self.term_rows[self.label_offsets[i]:self.label_offsets[i + 1]]
+        return self.eurovoc['TERMS (PT-NPT)'].to_numpy()[rows].tolist()
+
+    @property
+    def nlp(self):
+        # loaded on first use, the label merges don't need it
+        return get_nlp()
+
+    def _init_embeddings(self, cache_dir=EMBEDDING_CACHE_DIR, embedding_model=EMBEDDING_MODEL, verify_model=False):
         """This function is really only used for merging eurovoc labels together that are similar.
         see the merge_labels function below.
 
-        We use the auto labelling embedding framework to save on reproducing the same code.
+        We use the auto labelling embedding framework to save on reproducing the same code. The embedding of each phrase
+        is cached on disk (see PhraseEmbeddingCache), so only phrases never seen before are embedded, and the labels are
+        grouped here rather than by re-embedding when the MT column changes.
         """
-        al = AutoLabel(self.eurovoc, phrase_col="TERMS (PT-NPT)", label_col="MT")
-        al._init_embeddings()
-        self.phrase_embeddings = al.phrase_embeddings
-        self.eurovoc_topics = al.sorted_labels
+        cache = PhraseEmbeddingCache(cache_dir, embedding_model=embedding_model, verify_model=verify_model)
+        matrix, rows = cache.get(self.eurovoc["TERMS (PT-NPT)"].astype(str).to_list())
+        self.phrase_matrix = matrix
+        self.phrase_rows = rows
+        self.eurovoc_topics = sorted(self.eurovoc['MT'].unique())
+        order = np.argsort(pd.Categorical(self.eurovoc['MT'], categories=self.eurovoc_topics).codes, kind="stable")
+        labels = self.eurovoc['MT'].to_numpy()[order]
+        bounds = np.flatnonzero(labels[1:] != labels[:-1]) + 1
+        self.phrase_embeddings = [np.asarray(matrix[rows[group]]) for group in np.split(order, bounds)]
+
+    def label_sums(self):
+        """Sum and number of the phrase embeddings of each label (in the order of self.eurovoc_topics), aggregated
+        through a sparse label x phrase matrix. The label vector is their quotient, the mean phrase embedding.
+
+        Returns:
+            np.array, np.array: (labels, dim) sums and (labels,) counts
+        """
+        codes = pd.Categorical(self.eurovoc['MT'], categories=self.eurovoc_topics).codes
+        membership = sparse.csr_matrix((np.ones(len(codes)), (codes, self.phrase_rows)),
+                                       shape=(len(self.eurovoc_topics), self.phrase_matrix.shape[0]))
+        sums = np.asarray(membership @ np.asarray(self.phrase_matrix, dtype=np.float64))
+        counts = np.asarray(membership.sum(axis=1)).ravel()
+        return sums, counts
 
 
 def _find_sim_pairs(mat, eurovoc_labels, threshold):
@@ -69,7 +284,8 @@ def _find_sim_pairs(mat, eurovoc_labels, threshold):
     similar to each other.
 
     Args:
-        mat (np.array): pairwise similarity between all eurovoc labels
+        mat (np.array or sparse.spmatrix): pairwise similarity between eurovoc labels, dense or a sparse neighbour
+            graph (see SimilarityIndex.neighbours) where missing pairs are not similar
         eurovoc_labels (np.array): array containing eurovoc label names
         threshold (float): similarity threshold over which two labels are considered similar
 
@@ -77,92 +293,100 @@ def _find_sim_pairs(mat, eurovoc_labels, threshold):
         [tuple]: list of tuples returned of similar pairs of eurovoc labels
     """
     assert mat.shape[0] == len(eurovoc_labels)
-    sim_pairs = []
-    for i in range(mat.shape[0]):
-        for j in range(mat.shape[0]):
-            if j > i:
-                sim = mat[i][j]
-                if sim >= threshold:
-                    sim_pairs.append((eurovoc_labels[i],eurovoc_labels[j]))
-    return sim_pairs
+    if sparse.issparse(mat):
+        # a pair may only have been found from one side, upper triangle only after that, each pair once
+        graph = sparse.triu(mat.maximum(mat.T), k=1).tocoo()
+        similar = graph.data >= threshold
+        rows, cols = graph.row[similar], graph.col[similar]
+    else:
+        # upper triangle only, each pair once and no label with itself
+        rows, cols = np.nonzero(np.triu(np.asarray(mat) >= threshold, k=1))
+    return [(eurovoc_labels[i], eurovoc_labels[j]) for i, j in zip(rows, cols)]
 
 def _create_merge_plan(pairs):
-    # count number of times topic is in pairs
-    freqs = []
-    lookup = defaultdict(lambda: None)
-    merges = []
-    pairs = sorted(pairs, key=lambda x: x[0])
+    """Groups the labels of similar pairs transitively (union-find). Each group is merged into its label that appears in
+    the most pairs, ties going to the first label by name.
+
+    Returns:
+        dict, dict: label -> label it is merged into, label merged into -> labels of its group
+    """
+    c = Counter(label for pair in pairs for label in pair)
+    labels = sorted(c)
+    index = {label: i for i, label in enumerate(labels)}
+    groups = DisjointSet(len(labels))
     for l1, l2 in pairs:
-        freqs.extend([l1, l2])
-        if lookup[l1] == None and lookup[l2] == None:
-            # neither of these labels have been merged anywhere yet
-            merges.append(set([l1, l2]))
-            lookup[l1] = len(merges) - 1
-            lookup[l2] = len(merges) - 1
-        elif (lookup[l1] == None and lookup[l2] != None) or (lookup[l1] != None and lookup[l2] == None):
-            # one of the labels has been merged with something else
-            index = lookup[l1] if lookup[l1] != None else lookup[l2]
-            merges[index].add(l1)
-            merges[index].add(l2)
-            lookup[l1] = index
-            lookup[l2] = index
-        else:
-            # both of the labels exist elsewhere, we need to merge two sets
-            l1_index = lookup[l1]
-            l2_index = lookup[l2]
-            l1_set = merges[l1_index]
-            l2_set = merges[l2_index]
-            merged_set = l1_set.union(l2_set)
-            # we'll append this new merged set to end of list and update lookups
-            merges.append(merged_set)
-            for l in merged_set:
-                lookup[l] = len(merges) - 1
-    c = Counter(freqs)
+        groups.union(index[l1], index[l2])
+    members = defaultdict(list)
+    for label, root in zip(labels, groups.roots()):
+        members[root].append(label)
     merge_groups = {}
     merge_mapping = {}
-    merge_plans_to_take = set(lookup.values())
-    merges = [merges[i] for i in merge_plans_to_take]
-    for merge_action in merges:
-        most_common = sorted([(label, c[label]) for label in merge_action], key=lambda x: x[1], reverse=True)[0][0]
-        merge_groups[most_common] = list(merge_action)
+    for merge_action in members.values():
+        most_common = min(merge_action, key=lambda label: (-c[label], label))
+        merge_groups[most_common] = merge_action
         for label in merge_action:
             merge_mapping[label] = most_common
     return merge_mapping, merge_groups
 
-def _create_label_vectors(embeddings):
-    label_vecs = []
-    for i, label in enumerate(embeddings):
-        # pairwise cosine sim between top words and topic term vectors
-        label_mat = np.array(label)
-        label_vec = label_mat.mean(axis=0)
-        label_vecs.append(label_vec)
-    return label_vecs
+def _unit_rows(mat):
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return mat / norms
 
-def merge_labels(max_iterations, threshold=0.95):
+def merge_labels(max_iterations, threshold=0.95, eurovoc_whitelist=True, similarity="exact", max_memory=DEFAULT_MAX_MEMORY,
+                 embedding_model=EMBEDDING_MODEL, verify_model=False):
     """Given a threshold and some number of maximum iterations, this label takes the EuroVoc
     thesaurus and merges labels that are above the threshold of similarity. This repeats
     iteratively until no more labels are similar.
 
+    The phrases are only embedded once. Label vectors are kept as running sums and counts of their phrase embeddings, so
+    a merge only recomputes the vectors of the merged labels, and each following iteration only compares those. Similar
+    pairs come from a sparse neighbour graph (see similarity.py), the full label x label matrix is never built.
+
     Args:
         max_iterations (int): Max. number of merge iterations
         threshold (float, optional): threshold over which two labels are considered similar. Defaults to 0.95.
+        eurovoc_whitelist (bool, optional): only merge the whitelisted labels, else the whole thesaurus. Defaults to True.
+        similarity (str, optional): "exact" or "approximate" (LSH, may miss pairs close to the threshold). Defaults to "exact".
+        max_memory (int, optional): bytes a block of label similarities may take. Defaults to 256MB.
+        embedding_model (str, optional): identifier of AutoLabel's embedding model, the phrase embeddings are cached per
+            model. Defaults to EMBEDDING_MODEL.
+        verify_model (bool, optional): check the cached embeddings against the model (see PhraseEmbeddingCache). Defaults to False.
 
     Returns:
         list(dict), pd.DataFrame, list: list of merge steps for each iteration, EuroVoc with merged labels, list of all EuroVoc labels after merge
     """
-    e = Eurovoc(eurovoc_whitelist=True)
-    e._init_embeddings()
+    e = Eurovoc(eurovoc_whitelist=eurovoc_whitelist)
+    e._init_embeddings(embedding_model=embedding_model, verify_model=verify_model)
+    labels = list(e.eurovoc_topics)
+    label_rows = {label: i for i, label in enumerate(labels)}
+    # the vector (mean) of a merged label is the sum of its labels' sums over the sum of their counts
+    sums, counts = e.label_sums()
+    active = np.ones(len(labels), dtype=bool)
+    label_vecs = _unit_rows(sums / counts[:, None])
+    index = SimilarityIndex(label_vecs, mode=similarity, max_memory=max_memory)
+    pairs = _find_sim_pairs(index.neighbours(threshold), labels, threshold)
     steps = []
     for _ in range(max_iterations):
-        label_vecs = _create_label_vectors(e.phrase_embeddings)
-        sim_matrix = cosine_similarity(label_vecs, label_vecs)
-        pairs = _find_sim_pairs(sim_matrix, e.eurovoc_topics, threshold)
         merge_mapping, merge_groups = _create_merge_plan(pairs)
         if merge_groups == {}:
             break
         steps.append(merge_groups)
-        e.eurovoc['MT'] = e.eurovoc['MT'].apply(lambda x: merge_mapping[x] if x in merge_mapping else x)
-        e._init_embeddings()
+        new_rows = []
+        for most_common, group in merge_groups.items():
+            rows = [label_rows[label] for label in group]
+            row = label_rows[most_common]
+            sums[row] = sums[rows].sum(axis=0)
+            counts[row] = counts[rows].sum()
+            active[rows] = False
+            active[row] = True
+            label_vecs[row] = _unit_rows(sums[row:row + 1] / counts[row])[0]
+            new_rows.append(row)
+        e.eurovoc['MT'] = e.eurovoc['MT'].map(merge_mapping).fillna(e.eurovoc['MT'])
+        # only the merged labels have moved, every other pair was already found to be below the threshold
+        index.update(new_rows)
+        pairs = _find_sim_pairs(index.neighbours(threshold, rows=new_rows, active=active), labels, threshold)
+    e.eurovoc_topics = [label for label, is_active in zip(labels, active) if is_active]
     return steps, e.eurovoc, e.eurovoc_topics
 
 def merge_eurovoc_df_with_steps(steps):
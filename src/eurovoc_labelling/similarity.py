@@ -0,0 +1,133 @@
+"""Neighbour search over EuroVoc label vectors.
+
+merge_labels only needs the pairs of labels above a similarity threshold, which is a sparse graph, so the full
+label x label similarity matrix is never materialised. SimilarityIndex finds the graph either exactly, comparing tiles of
+rows whose similarity block fits in max_memory, or approximately, only comparing labels that share a bucket of a random
+hyperplane (SimHash) hash in at least one of several tables.
+"""
+
+import numpy as np
+from scipy import sparse
+
+# bytes the working arrays of a search (candidate vectors and a tile of similarities, or candidate pairs) may take
+DEFAULT_MAX_MEMORY = 256 * 2 ** 20
+
+
+def _top_k(rows, cols, sims, k):
+    """Keeps the k most similar neighbours of each row.
+    """
+    order = np.lexsort((-sims, rows))
+    rows, cols, sims = rows[order], cols[order], sims[order]
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+    lengths = np.diff(np.r_[starts, len(rows)])
+    rank = np.arange(len(rows)) - np.repeat(starts, lengths)
+    keep = rank < k
+    return rows[keep], cols[keep], sims[keep]
+
+
+class SimilarityIndex:
+    """Cosine similarity neighbour graph over unit length vectors.
+
+    The index keeps a reference to vecs: after changing rows of it in place, call update with those rows so the
+    approximate mode rehashes them.
+
+    Args:
+        vecs (np.array): (n, dim) unit length vectors
+        mode (str, optional): "exact" (blocked) or "approximate" (random hyperplane LSH). Defaults to "exact".
+        max_memory (int, optional): bytes the exact mode's working arrays (the candidate vectors and a tile of
+            similarities) and a block of the approximate mode's candidate pairs may take. Defaults to DEFAULT_MAX_MEMORY.
+        k (int, optional): keep at most the k most similar neighbours of each row. Defaults to None (all).
+        n_bits (int, optional): hyperplanes per hash table, more is fewer (and more similar) candidates. Defaults to 12.
+        n_tables (int, optional): hash tables, more is fewer missed neighbours. Defaults to 16.
+        seed (int, optional): seed of the hyperplanes. Defaults to 0.
+    """
+
+    def __init__(self, vecs, mode="exact", max_memory=DEFAULT_MAX_MEMORY, k=None, n_bits=12, n_tables=16, seed=0):
+        assert mode in ("exact", "approximate"), f"unknown similarity mode {mode}"
+        self.vecs = vecs
+        self.mode = mode
+        self.max_memory = max_memory
+        self.k = k
+        if mode == "approximate":
+            self.planes = np.random.RandomState(seed).randn(n_tables, n_bits, vecs.shape[1])
+            self.codes = np.empty((len(vecs), n_tables), dtype=np.int64)
+            self.update(np.arange(len(vecs)))
+
+    def update(self, rows):
+        """Rehashes rows of vecs that changed.
+        """
+        if self.mode != "approximate":
+            return
+        rows = np.asarray(rows, dtype=np.int64)
+        bits = np.einsum("tbd,nd->ntb", self.planes, self.vecs[rows]) > 0
+        self.codes[rows] = bits @ (1 << np.arange(self.planes.shape[1], dtype=np.int64))
+
+    def _block_size(self, width):
+        return max(1, self.max_memory // (8 * max(width, 1)))
+
+    def _exact_pairs(self, rows, candidates, threshold):
+        itemsize = self.vecs.dtype.itemsize
+        dim = self.vecs.shape[1]
+        # the candidate vectors are copied once and take at most half the budget (more candidates are split into
+        # several column blocks), the rest goes to a tile of similarities, its threshold mask and the tile's own vectors
+        col_step = max(1, self.max_memory // 2 // (itemsize * dim))
+        for col_start in range(0, len(candidates), col_step):
+            cols = candidates[col_start:col_start + col_step]
+            col_vecs = self.vecs[cols]
+            step = max(1, (self.max_memory - col_vecs.nbytes) // ((itemsize + 1) * len(cols) + itemsize * dim))
+            for start in range(0, len(rows), step):
+                block = rows[start:start + step]
+                sims = self.vecs[block] @ col_vecs.T
+                i, j = np.nonzero(sims >= threshold)
+                if len(i):
+                    yield block[i], cols[j], sims[i, j]
+                # freed before the next tile (and column block) is allocated, not after
+                del sims
+            del col_vecs
+
+    def _approximate_pairs(self, rows, candidates, threshold):
+        # candidates sorted by their code in each table, the bucket of a row is a range of them
+        tables = []
+        for t in range(self.codes.shape[1]):
+            order = np.argsort(self.codes[candidates, t], kind="stable")
+            tables.append((candidates[order], self.codes[candidates[order], t]))
+        step = self._block_size(len(candidates))
+        for start in range(0, len(rows), step):
+            block = rows[start:start + step]
+            keys = []
+            for t, (members, codes) in enumerate(tables):
+                lo = np.searchsorted(codes, self.codes[block, t], side="left")
+                hi = np.searchsorted(codes, self.codes[block, t], side="right")
+                lengths = hi - lo
+                offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+                keys.append(np.repeat(block, lengths) * len(self.vecs) + members[np.repeat(lo, lengths) + offsets])
+            keys = np.unique(np.concatenate(keys))
+            i, j = np.divmod(keys, len(self.vecs))
+            chunk = self._block_size(self.vecs.shape[1])
+            sims = np.concatenate([np.einsum("ij,ij->i", self.vecs[i[s:s + chunk]], self.vecs[j[s:s + chunk]])
+                                   for s in range(0, len(keys), chunk)] or [np.empty(0)])
+            keep = sims >= threshold
+            yield i[keep], j[keep], sims[keep]
+
+    def neighbours(self, threshold, rows=None, active=None):
+        """Similarity graph between rows and the active vectors, with the pairs at or over the threshold only.
+
+        Args:
+            threshold (float): minimum cosine similarity
+            rows (np.array, optional): rows to find the neighbours of. Defaults to None (all active rows).
+            active (np.array, optional): boolean mask of the vectors that can be neighbours. Defaults to None (all).
+
+        Returns:
+            sparse.csr_matrix: (n, n) similarities of the pairs found, without the diagonal
+        """
+        n = len(self.vecs)
+        candidates = np.arange(n) if active is None else np.flatnonzero(active)
+        rows = candidates if rows is None else np.asarray(sorted(rows), dtype=np.int64)
+        search = self._exact_pairs if self.mode == "exact" else self._approximate_pairs
+        found = list(search(rows, candidates, threshold))
+        i, j, s = (np.concatenate(part) for part in zip(*found)) if found else (np.empty(0, dtype=np.int64),) * 3
+        not_self = i != j
+        i, j, s = i[not_self], j[not_self], s[not_self]
+        if self.k is not None:
+            i, j, s = _top_k(i, j, s, self.k)
+        return sparse.csr_matrix((s, (i, j)), shape=(n, n))
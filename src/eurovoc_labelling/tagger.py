@@ -0,0 +1,147 @@
+"""Thesaurus based EuroVoc labelling of the corpus.
+
+EurovocTagger compiles every term of the thesaurus into one spaCy PhraseMatcher and runs it over the paragraphs in a
+single pass, counting the matches of the terms of each MT label. This gives every paragraph a label signal without
+comparing it to the embeddings of each label.
+
+To run (tags the dataset written by pipeline.py, parquet or pickle): python3 tagger.py
+"""
+
+import os
+import sys
+import json
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from utils.nlp import get_nlp
+from eurovoc import Eurovoc
+
+NUM_CPU = os.cpu_count() - 1 if os.cpu_count() > 1 else 1
+DATASET_PATH = "../../static/corpora/eia_dataset"
+DATASET_PICKLE_PATH = "../../static/corpora/eia_dataset.pickle"
+TAGS_PATH = "../../static/eurovoc/tags"
+
+
+class EurovocTagger:
+    """Counts the EuroVoc terms of each MT label in texts.
+
+    Args:
+        eurovoc (Eurovoc, optional): the thesaurus. Defaults to None (the whitelisted thesaurus).
+        attr (str, optional): token attribute the terms are matched on, "LOWER" only needs the tokenizer, "LEMMA" also
+            matches inflected forms but runs the tagger and lemmatizer. Defaults to "LOWER".
+        nlp (spacy.language.Language, optional): pipeline to use. Defaults to None (the shared pipeline).
+    """
+
+    def __init__(self, eurovoc=None, attr="LOWER", nlp=None):
+        assert attr in ("LOWER", "LEMMA"), f"can't match on {attr}"
+        self.eurovoc = eurovoc if eurovoc is not None else Eurovoc(eurovoc_whitelist=True)
+        self.attr = attr
+        self._nlp = nlp
+        self._matcher = None
+        self.terms = list(self.eurovoc.term_labels)
+        # (terms, labels) membership, a term can belong to several labels
+        rows = np.repeat(np.arange(len(self.terms)), [len(self.eurovoc.term_labels[t]) for t in self.terms])
+        cols = np.fromiter((code for t in self.terms for code in self.eurovoc.term_labels[t]), dtype=np.int64, count=len(rows))
+        self.term_label_matrix = sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, cols)),
+                                                   shape=(len(self.terms), len(self.eurovoc.labels)))
+
+    @property
+    def nlp(self):
+        if self._nlp is None:
+            self._nlp = get_nlp()
+        return self._nlp
+
+    @property
+    def disable(self):
+        """Components not needed to get the matched attribute.
+        """
+        if self.attr == "LOWER":
+            return list(self.nlp.pipe_names)
+        return [name for name in ("parser", "ner", "sentencizer") if name in self.nlp.pipe_names]
+
+    @property
+    def matcher(self):
+        """PhraseMatcher over all terms, the match id of a term is the string "<term index>". Built on first use.
+        """
+        if self._matcher is None:
+            from spacy.matcher import PhraseMatcher
+            self._matcher = PhraseMatcher(self.nlp.vocab, attr=self.attr)
+            patterns = self.nlp.pipe(self.terms, disable=self.disable, batch_size=1024)
+            for i, pattern in enumerate(patterns):
+                self._matcher.add(str(i), [pattern])
+            self._term_ids = {self.nlp.vocab.strings[str(i)]: i for i in range(len(self.terms))}
+        return self._matcher
+
+    def _term_counts(self, docs, n_docs):
+        """(docs, terms) counts of the longest non-overlapping matches of each doc.
+        """
+        from spacy.util import filter_spans
+        matcher = self.matcher
+        doc_ids, term_ids = [], []
+        for i, doc in enumerate(docs):
+            for span in filter_spans(matcher(doc, as_spans=True)):
+                doc_ids.append(i)
+                term_ids.append(self._term_ids[span.label])
+        return sparse.csr_matrix((np.ones(len(doc_ids), dtype=np.int32), (doc_ids, term_ids)),
+                                 shape=(n_docs, len(self.terms)))
+
+    def tag(self, texts, n_process=1, batch_size=256):
+        """Counts the term matches of each MT label in each text. Each distinct text is only processed once.
+
+        Args:
+            texts (list): texts to tag
+            n_process (int, optional): processes nlp.pipe runs with. Defaults to 1.
+            batch_size (int, optional): texts per nlp.pipe batch. Defaults to 256.
+
+        Returns:
+            sparse.csr_matrix: (texts, labels) counts, the columns are in the order of self.eurovoc.labels
+        """
+        inverse, unique_texts = pd.factorize(pd.Series(texts, dtype=object).fillna(""))
+        docs = self.nlp.pipe(unique_texts, disable=self.disable, n_process=n_process, batch_size=batch_size)
+        counts = self._term_counts(docs, len(unique_texts)) @ self.term_label_matrix
+        return counts.tocsr()[inverse]
+
+    def tag_frame(self, df, text_col="filt_para_text", by=("doc_category", "year"), n_process=NUM_CPU, batch_size=256):
+        """Tags the paragraphs of a dataframe, grouped by year and category.
+
+        Args:
+            df (pd.DataFrame): the paragraphs
+            text_col (str, optional): column with the text to tag. Defaults to "filt_para_text".
+            by (tuple, optional): columns to group the paragraphs by. Defaults to ("doc_category", "year").
+            n_process (int, optional): processes nlp.pipe runs with. Defaults to NUM_CPU.
+            batch_size (int, optional): texts per nlp.pipe batch. Defaults to 256.
+
+        Returns:
+            dict: group -> (index of the paragraphs of the group in df, (paragraphs, labels) csr count matrix)
+        """
+        counts = self.tag(df[text_col].to_list(), n_process=n_process, batch_size=batch_size)
+        groups = df.groupby(list(by), sort=True, observed=True).indices
+        return {key: (df.index[rows], counts[rows]) for key, rows in groups.items()}
+
+
+def save_tags(tags, labels, path=TAGS_PATH):
+    """Writes each group's count matrix as <group>.npz, with the MT label of each column in labels.json.
+    """
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "labels.json"), "w") as fp:
+        json.dump(list(labels), fp)
+    for key, (index, counts) in tags.items():
+        name = "_".join(str(k) for k in (key if isinstance(key, tuple) else (key,)))
+        sparse.save_npz(os.path.join(path, f"{name}.npz"), counts)
+        np.save(os.path.join(path, f"{name}_index.npy"), np.asarray(index))
+
+
+if __name__ == "__main__":
+    columns = ["filt_para_text", "doc_category", "year"]
+    if os.path.isdir(DATASET_PATH):
+        from utils.dataset import read_dataset
+        df = read_dataset(DATASET_PATH, columns=columns)
+    else:
+        df = pd.read_pickle(DATASET_PICKLE_PATH)[columns]
+    tagger = EurovocTagger()
+    tags = tagger.tag_frame(df)
+    save_tags(tags, tagger.eurovoc.labels)
+    print(f"tagged {len(df)} paragraphs in {len(tags)} groups, saved to {TAGS_PATH}")
@@ -1,9 +1,14 @@
-from dataframe import DataFrameCreator
-from converter import bulk_convert
-from dtm_toolkit.lucy import run_measuring_space
-from data_collection.run import run
-import json
+"""Runs the full pipeline: scraping, pdf conversion, dataframe creation (and enrichment) and lucy's measuring space.
+
+To run: python3 pipeline.py [--no-scrape] [--no-conversion] [--no-enrich] [--no-lucy] [--output-format parquet]
+"""
 
+import argparse
+import json
+from dataframe import DataFrameCreator
+from utils.dataset import write_dataset, pyarrow_available
+# the scraper (scrapy), the converter (pdfminer) and lucy are imported when their step runs, so a run skipping
+# them doesn't pay for the imports
 
 
 def create_dataframe_from_structured(enrich=True, save=False):
@@ -15,26 +20,57 @@ def create_dataframe_from_structured(enrich=True, save=False):
     if enrich:
         df = dfc.run(lemm_pos=True, tfidf=True, save=save)
     else:
-        df = dfc.run(lemm_pos=False, tfidf=False, save=save)
+        df = dfc.run(lemm_pos=False, tfidf=False, save=save, enrich=False)
     return df
 
 
-def pipeline(run_scrape=True, run_conversion=True, run_dataframe_creation=True, enrich=True, run_lucy=True):
+def pipeline(run_scrape=True, run_conversion=True, run_dataframe_creation=True, enrich=True, run_lucy=True, output_format="pickle"):
+    """Runs the scrape, conversion and dataframe creation steps. The final dataset is written as a single pickle, or
+    with output_format="parquet" as a parquet dataset partitioned by doc_category and year (see utils/dataset.py),
+    which needs pyarrow. If a column can't be stored in parquet the pickle is written instead.
+    """
+    if output_format == "parquet" and run_dataframe_creation and not pyarrow_available():
+        # checked up front rather than after the scrape, conversion and enrichment
+        raise ImportError("--output-format parquet needs pyarrow, install it with: pip install pyarrow")
     # run scrape
     if run_scrape:
+        from data_collection.run import run
         run()
     if run_conversion:
+        from converter import bulk_convert
         bulk_convert()
     if run_dataframe_creation:
         df = create_dataframe_from_structured(enrich, save=False)
+        enriched_df = df
         if run_lucy:
+            from dtm_toolkit.lucy import run_measuring_space
             with open("../static/corpora/energy_technology.json") as fp:
                 matcher_keywords = json.load(fp)
-            breakpoint()
             enriched_df = run_measuring_space(df, "para_text", matcher_keywords, save=False)
         enriched_df = enriched_df.dropna(subset=["year"])
+        if output_format == "parquet":
+            try:
+                write_dataset(enriched_df, "../static/corpora/eia_dataset")
+                return
+            except (ValueError, TypeError) as e:
+                # pyarrow's conversion errors, e.g. an object column it has no type for
+                print(f"couldn't write the parquet dataset ({e}), writing the pickle instead.")
         enriched_df.to_pickle("../static/corpora/eia_dataset.pickle", protocol=4)
 
-if __name__ == "__main__":
-    pipeline()
 
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--no-scrape", dest="run_scrape", action="store_false")
+    parser.add_argument("--no-conversion", dest="run_conversion", action="store_false")
+    parser.add_argument("--no-dataframe", dest="run_dataframe_creation", action="store_false")
+    parser.add_argument("--no-enrich", dest="enrich", action="store_false",
+                        help="skip the spaCy/tf-idf enrichment, no model is loaded")
+    parser.add_argument("--no-lucy", dest="run_lucy", action="store_false")
+    parser.add_argument("--output-format", choices=["pickle", "parquet"], default="pickle",
+                        help="parquet needs pyarrow (pip install pyarrow)")
+    args = parser.parse_args()
+    pipeline(**vars(args))
+
+
+if __name__ == "__main__":
+    main()
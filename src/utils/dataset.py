@@ -0,0 +1,96 @@
+"""Columnar (parquet) storage of the header-paragraph dataframe produced by DataFrameCreator.
+
+The dataset is a directory of parquet files partitioned by doc_category and year (hive layout, e.g.
+aeo/year=2010/...), with the list valued enrichment columns (para_tfidf, lemm_pos_filt_para_text) stored as native
+nested columns. Unlike the pickle and csv outputs, a reader only pays for the columns and partitions it asks for:
+
+    df = read_dataset("../static/corpora/eia_dataset", columns=["filt_para_text"], years=[2010])
+
+Needs pyarrow (pip install pyarrow), which is only imported when a dataset is read or written.
+"""
+
+import os
+import shutil
+
+PARTITION_COLS = ["doc_category", "year"]
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("parquet datasets need pyarrow, install it with: pip install pyarrow")
+    return pa, pq
+
+
+def pyarrow_available():
+    """Whether pyarrow can be imported, so callers can check before doing the work whose output they'd write.
+    """
+    try:
+        _import_pyarrow()
+    except ImportError:
+        return False
+    return True
+
+
+def _partitioning(pa):
+    # typed explicitly, otherwise the partition columns are read back as dictionaries
+    return pa.dataset.partitioning(pa.schema([("doc_category", pa.string()), ("year", pa.int32())]), flavor="hive")
+
+
+def _nested_types(pa):
+    return {
+        "para_tfidf": pa.list_(pa.string()),
+        "lemm_pos_filt_para_text": pa.list_(pa.struct([("lemma", pa.string()), ("pos", pa.string())])),
+    }
+
+
+def write_dataset(df, path):
+    """Writes a dataframe as a parquet dataset partitioned by doc_category and year, replacing any dataset at path.
+
+    Args:
+        df (pd.DataFrame): header-paragraph dataframe, see DataFrameCreator.run
+        path (str): directory of the dataset
+    """
+    pa, pq = _import_pyarrow()
+    df = df.copy()
+    if "year" in df:
+        # rows without a year would otherwise turn the partition column into floats
+        df["year"] = df["year"].astype("Int64")
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for name, type_ in _nested_types(pa).items():
+        if name in df:
+            # (lemma, pos) tuples become structs rather than lists of strings
+            table = table.set_column(table.schema.get_field_index(name), name, pa.array(df[name].to_list(), type=type_))
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    pq.write_to_dataset(table, tmp_path, partition_cols=[col for col in PARTITION_COLS if col in df])
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.rename(tmp_path, path)
+
+
+def read_dataset(path, columns=None, years=None, categories=None, memory_map=True):
+    """Reads (part of) a parquet dataset written by write_dataset. Only the requested columns of the requested
+    partitions are read.
+
+    Args:
+        path (str): directory of the dataset
+        columns (list, optional): columns to load. Defaults to None, all columns.
+        years (list, optional): years to load. Defaults to None, all years.
+        categories (list, optional): doc_categories to load. Defaults to None, all categories.
+        memory_map (bool, optional): memory map the parquet files rather than reading them into memory. Defaults to True.
+
+    Returns:
+        pd.DataFrame: para_tfidf holds arrays of terms and lemm_pos_filt_para_text arrays of {"lemma", "pos"} dicts
+    """
+    pa, pq = _import_pyarrow()
+    filters = []
+    if years is not None:
+        filters.append(("year", "in", list(years)))
+    if categories is not None:
+        filters.append(("doc_category", "in", list(categories)))
+    table = pq.read_table(path, columns=columns, filters=filters or None, memory_map=memory_map,
+                          partitioning=_partitioning(pa))
+    return table.to_pandas()
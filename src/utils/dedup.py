@@ -0,0 +1,152 @@
+"""Duplicate index over the paragraphs of the corpus.
+
+AEO and IEO editions repeat a lot of boilerplate from year to year. ParagraphIndex maps every row to its distinct
+paragraph text (exact duplicates), so enrichment can run once per distinct paragraph and be fanned back out with
+ParagraphIndex.expand, and groups paragraphs that are near duplicates of each other into clusters using MinHash
+signatures of word shingles and locality sensitive hashing (banding) over them.
+"""
+
+import zlib
+
+import numpy as np
+
+from utils.union_find import DisjointSet
+
+# 2^31 - 1, small enough that (a * x + b) never overflows uint64 for a, b, x below it
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+
+
+def shingle_hashes(text, shingle_size=3):
+    """crc32 hashes of the lower cased word shingles of a text. Texts shorter than a shingle are a single shingle.
+    """
+    words = text.lower().split()
+    if len(words) <= shingle_size:
+        shingles = [" ".join(words)]
+    else:
+        shingles = [" ".join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)]
+    return np.unique(np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles)))
+
+
+def minhash_signatures(texts, num_perm=128, shingle_size=3, seed=0, block_size=1 << 16):
+    """MinHash signature of each text, the share of equal entries of two signatures estimates the Jaccard similarity of
+    the shingle sets of the texts.
+
+    Args:
+        texts (list): texts to sign
+        num_perm (int, optional): length of the signatures. Defaults to 128.
+        shingle_size (int, optional): words per shingle. Defaults to 3.
+        seed (int, optional): seed of the hash functions. Defaults to 0.
+        block_size (int, optional): shingles hashed at once, bounds memory to num_perm * block_size * 8 bytes (64MB with
+            the defaults). Defaults to 2^16.
+
+    Returns:
+        np.ndarray: (len(texts), num_perm) uint64 signatures
+    """
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, int(_MERSENNE_PRIME), size=num_perm).astype(np.uint64)
+    b = rng.randint(0, int(_MERSENNE_PRIME), size=num_perm).astype(np.uint64)
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint64)
+    start = 0
+    while start < len(texts):
+        # take whole texts until the block is full
+        hashes = []
+        n_shingles = 0
+        stop = start
+        while stop < len(texts) and (n_shingles < block_size or stop == start):
+            h = shingle_hashes(texts[stop], shingle_size) % _MERSENNE_PRIME
+            hashes.append(h)
+            n_shingles += len(h)
+            stop += 1
+        offsets = np.cumsum([0] + [len(h) for h in hashes[:-1]])
+        # in place, so the block is the only (num_perm, shingles) array
+        permuted = a[:, None] * np.concatenate(hashes)[None, :]
+        permuted += b[:, None]
+        permuted %= _MERSENNE_PRIME
+        signatures[start:stop] = np.minimum.reduceat(permuted, offsets, axis=1).T
+        start = stop
+    return signatures
+
+
+def near_duplicate_clusters(signatures, bands=16, threshold=0.8, max_bucket_size=64):
+    """Clusters texts whose MinHash signatures agree on at least threshold of their entries. Candidates are the texts
+    sharing a bucket in any band of the signatures, so only those pairs are compared.
+
+    Every pair of a bucket is compared when the bucket has at most max_bucket_size texts. In larger buckets (mostly
+    boilerplate repeated with small variations) each text is only compared with the first text of the bucket, to keep
+    the work linear, so a near duplicate of another text of the bucket that isn't also similar to the first is missed
+    unless another band brings the two together.
+
+    Args:
+        signatures (np.ndarray): MinHash signatures, see minhash_signatures
+        bands (int, optional): number of bands, must divide the signature length. Defaults to 16.
+        threshold (float, optional): minimum estimated Jaccard similarity. Defaults to 0.8.
+        max_bucket_size (int, optional): largest bucket whose pairs are all compared. Defaults to 64.
+
+    Returns:
+        np.ndarray: cluster id of each text, numbered from 0 in order of first appearance
+    """
+    n, num_perm = signatures.shape
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+    assert num_perm % bands == 0, "bands must divide the signature length"
+    rows = num_perm // bands
+    clusters = DisjointSet(n)
+    for band in range(bands):
+        _, buckets = np.unique(signatures[:, band * rows:(band + 1) * rows], axis=0, return_inverse=True)
+        buckets = buckets.ravel()
+        order = np.argsort(buckets, kind="stable")
+        bounds = np.flatnonzero(np.diff(buckets[order])) + 1
+        for members in np.split(order, bounds):
+            if len(members) < 2:
+                continue
+            if len(members) <= max_bucket_size:
+                bucket = signatures[members]
+                similar = (bucket[:, None, :] == bucket[None, :, :]).mean(axis=2) >= threshold
+                for i, j in zip(*np.nonzero(np.triu(similar, k=1))):
+                    clusters.union(members[i], members[j])
+                continue
+            first = members[0]
+            similar = (signatures[members[1:]] == signatures[first]).mean(axis=1) >= threshold
+            for other in members[1:][similar]:
+                clusters.union(first, other)
+    _, first_seen, labels = np.unique(np.array(clusters.roots()), return_index=True, return_inverse=True)
+    # renumber in order of first appearance
+    rank = np.empty(len(first_seen), dtype=np.int64)
+    rank[np.argsort(first_seen)] = np.arange(len(first_seen))
+    return rank[labels.ravel()]
+
+
+class ParagraphIndex:
+    """Exact and near duplicate index of a sequence of paragraphs.
+
+    Attributes:
+        unique_texts (list): the distinct paragraphs, in order of first appearance
+        inverse (np.ndarray): for each paragraph, the index of its text in unique_texts
+        counts (np.ndarray): number of occurrences of each distinct paragraph
+        clusters (np.ndarray): near duplicate cluster id of each paragraph, exact duplicates share a cluster. None when
+            built with near_duplicates=False, which skips the MinHash signatures.
+    """
+
+    def __init__(self, texts, num_perm=128, bands=16, threshold=0.8, shingle_size=3, near_duplicates=True):
+        ids = {}
+        self.inverse = np.fromiter((ids.setdefault(text, len(ids)) for text in texts), dtype=np.int64)
+        self.unique_texts = list(ids)
+        self.counts = np.bincount(self.inverse, minlength=len(self.unique_texts))
+        self.unique_clusters = None
+        self.clusters = None
+        if near_duplicates:
+            signatures = minhash_signatures(self.unique_texts, num_perm=num_perm, shingle_size=shingle_size)
+            self.unique_clusters = near_duplicate_clusters(signatures, bands=bands, threshold=threshold)
+            self.clusters = self.unique_clusters[self.inverse]
+
+    def expand(self, unique_values):
+        """Fans values computed once per distinct paragraph back out to every paragraph.
+        """
+        return [unique_values[i] for i in self.inverse]
+
+    def report(self):
+        if self.unique_clusters is None:
+            print(f"{len(self.inverse)} paragraphs, {len(self.unique_texts)} distinct.")
+            return
+        n_clusters = len(np.unique(self.unique_clusters))
+        print(f"{len(self.inverse)} paragraphs, {len(self.unique_texts)} distinct, {n_clusters} near duplicate clusters.")
@@ -0,0 +1,125 @@
+"""Backends that lay a pdf out into the per-page TextLine stream consumed by RoadmapPDFConverter.
+
+pdfminer.six (through CustomRoadMapConverter) is the reference backend. Other backends emit the same stream, i.e.
+per page, a list of TextLine runs of a single rounded font size, where a run that ends a line keeps its trailing
+newline and a run that ends part way through a line has its whitespace collapsed. The backend is chosen with the
+"extractor" item of a category config (e.g. aeo_config.json) or a document's .conf.
+
+Run benchmarks/extractor_parity.py before switching a category to another backend, the reading order and spacing
+of other backends can differ from pdfminer's.
+"""
+
+import abc
+from itertools import islice
+
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+
+from utils.pdf import CustomRoadMapConverter, TextLine
+
+DEFAULT_EXTRACTOR = "pdfminer"
+
+
+class LineExtractor(abc.ABC):
+    """Interface of a layout backend. A backend that doesn't implement iter_pages can't be instantiated.
+    """
+    name = None
+
+    @abc.abstractmethod
+    def iter_pages(self, pdf_file, laparams, start=0, stop=None):
+        """Lays out the pages [start, stop) of a pdf one page at a time, yielding the lines of each page as soon as
+        that page has been processed. Page numbers in the yielded lines are the zero-based page numbers of the whole
+        document.
+
+        Args:
+            pdf_file (String): the path to the pdf file to be laid out
+            laparams (LAParams): pdfminer layout parameters, backends other than pdfminer may ignore them
+            start (int, optional): first page to lay out. Defaults to 0.
+            stop (int, optional): page to stop before. Defaults to None, the end of the document.
+
+        Yields:
+            list: the unfiltered TextLine records of a single page
+        """
+
+
+class PDFMinerExtractor(LineExtractor):
+    name = "pdfminer"
+
+    def iter_pages(self, pdf_file, laparams, start=0, stop=None):
+        with open(pdf_file, 'rb') as in_file:
+            parser = PDFParser(in_file)
+            doc = PDFDocument(parser)
+            rsrcmgr = PDFResourceManager()
+            device = CustomRoadMapConverter(rsrcmgr, laparams=laparams, page_number=start)
+            interpreter = PDFPageInterpreter(rsrcmgr, device)
+            for page in islice(PDFPage.create_pages(doc), start, stop):
+                interpreter.process_page(page)
+                yield device.pop_lines()
+
+
+class PyMuPDFExtractor(LineExtractor):
+    """Backend using PyMuPDF (pip install pymupdf), typically an order of magnitude faster than pdfminer. Blocks come
+    in PyMuPDF's reading order and laparams are ignored.
+    """
+    name = "pymupdf"
+
+    def iter_pages(self, pdf_file, laparams, start=0, stop=None):
+        try:
+            import pymupdf
+        except ImportError:
+            try:
+                # PyMuPDF < 1.24.3 is only importable as fitz
+                import fitz as pymupdf
+            except ImportError:
+                raise ImportError("the pymupdf extractor needs PyMuPDF, install it with: pip install pymupdf")
+        with pymupdf.open(pdf_file) as doc:
+            stop = doc.page_count if stop is None else min(stop, doc.page_count)
+            for page_number in range(start, stop):
+                lines = []
+                for block in doc.load_page(page_number).get_text("dict")["blocks"]:
+                    if block.get("type", 0) != 0:
+                        # image block
+                        continue
+                    for line in block["lines"]:
+                        self._split_line(line, page_number, lines)
+                yield lines
+
+    @staticmethod
+    def _split_line(line, page_number, lines):
+        """Splits a PyMuPDF line into runs of a single rounded font size, mirroring utils.pdf._split_text_line.
+        """
+        size = None
+        parts = None
+        for span in line["spans"]:
+            span_size = round(span["size"])
+            if size is None:
+                size = span_size
+                parts = [span["text"]]
+            elif size != span_size:
+                text = ''.join(parts)
+                if text:
+                    lines.append(TextLine(size, ' '.join(text.split()), page_number))
+                size = span_size
+                parts = [span["text"]]
+            else:
+                parts.append(span["text"])
+        if parts is not None:
+            # pdfminer ends every text line with a newline, which the config exclusions rely on
+            lines.append(TextLine(size, ''.join(parts) + "\n", page_number))
+
+
+EXTRACTORS = {extractor.name: extractor for extractor in (PDFMinerExtractor, PyMuPDFExtractor)}
+
+
+def get_extractor(name=DEFAULT_EXTRACTOR):
+    if name not in EXTRACTORS:
+        raise ValueError(f"unknown extractor {name}, expected one of {', '.join(EXTRACTORS)}")
+    return EXTRACTORS[name]()
+
+
+def count_pages(pdf_file):
+    with open(pdf_file, 'rb') as in_file:
+        doc = PDFDocument(PDFParser(in_file))
+        return sum(1 for _ in PDFPage.create_pages(doc))
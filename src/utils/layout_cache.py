@@ -0,0 +1,128 @@
+"""On-disk cache of the raw (unfiltered) line stream produced by CustomRoadMapConverter.
+
+Laying a pdf out with pdfminer is by far the most expensive part of conversion, while most changes to a document's
+config (exclusions_exact, exclusions_page, inclusions_font, table_of_contents) are only applied after layout. Caching
+the unfiltered lines lets the filtering, preprocessing and chunk merging be replayed without laying the pdf out again.
+
+Each cache file holds one block per page, written as the page is laid out:
+
+    page number (int32) | number of lines (uint32) | sizes (int32 x lines) | text lengths (uint32 x lines) | utf-8 text
+
+so a document can be both written and replayed one page at a time.
+"""
+
+import hashlib
+import json
+import os
+import struct
+import sys
+from array import array
+
+from utils.pdf import LAYOUT_VERSION, TextLine
+
+MAGIC = b"RMLAYOUT1\n"
+_PAGE_HEADER = struct.Struct("<iII")
+# sentinels stored in the size column for lines without a size, see CustomRoadMapConverter.receive_layout
+_NO_SIZE = -1
+_EMPTY = -2
+
+
+class LayoutCache:
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def path(self, pdf_hash, laparams, extractor="pdfminer"):
+        """Cache file path of a pdf laid out with the given layout parameters.
+
+        Args:
+            pdf_hash (str): hash of the pdf file content
+            laparams (LAParams): pdfminer layout parameters
+            extractor (str, optional): name of the layout backend. Defaults to "pdfminer".
+        """
+        params = json.dumps(vars(laparams) if laparams is not None else None, sort_keys=True)
+        key = hashlib.sha256(f"{extractor}:{LAYOUT_VERSION}:{params}".encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{pdf_hash}_{key}.lines")
+
+    def read(self, path):
+        """Replays the cached line stream of a pdf.
+
+        Yields:
+            list: the unfiltered lines of a single page
+        """
+        with open(path, "rb") as fp:
+            if fp.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a layout cache file")
+            while True:
+                header = fp.read(_PAGE_HEADER.size)
+                if not header:
+                    break
+                page, n_lines, n_bytes = _PAGE_HEADER.unpack(header)
+                sizes = _read_array(fp, "i", n_lines)
+                lengths = _read_array(fp, "I", n_lines)
+                text = fp.read(n_bytes).decode("utf-8", "surrogatepass")
+                lines = []
+                offset = 0
+                for size, length in zip(sizes, lengths):
+                    if size == _EMPTY:
+                        lines.append(TextLine())
+                        continue
+                    line_text = text[offset:offset + length]
+                    offset += length
+                    lines.append(TextLine(None if size == _NO_SIZE else size, line_text, page))
+                yield lines
+
+    def write(self, path, pages):
+        """Writes the line stream of a pdf to the cache while passing it through. The cache file only
+        appears once every page has been written, so an interrupted layout never leaves a partial entry.
+
+        Args:
+            path (str): cache file path, see LayoutCache.path
+            pages (iterable): the unfiltered lines of each page
+
+        Yields:
+            list: the unfiltered lines of a single page
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as fp:
+                fp.write(MAGIC)
+                for lines in pages:
+                    _write_page(fp, lines)
+                    yield lines
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def _write_page(fp, lines):
+    page = next((line.page for line in lines if line.page is not None), -1)
+    sizes = array("i")
+    lengths = array("I")
+    texts = []
+    for line in lines:
+        if line.text is None:
+            sizes.append(_EMPTY)
+            lengths.append(0)
+            continue
+        sizes.append(line.size if line.size is not None else _NO_SIZE)
+        lengths.append(len(line.text))
+        texts.append(line.text)
+    text = "".join(texts).encode("utf-8", "surrogatepass")
+    fp.write(_PAGE_HEADER.pack(page, len(lines), len(text)))
+    fp.write(_to_little_endian(sizes).tobytes())
+    fp.write(_to_little_endian(lengths).tobytes())
+    fp.write(text)
+
+
+def _read_array(fp, typecode, n):
+    arr = array(typecode)
+    arr.frombytes(fp.read(arr.itemsize * n))
+    return _to_little_endian(arr)
+
+
+def _to_little_endian(arr):
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr
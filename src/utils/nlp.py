@@ -0,0 +1,30 @@
+"""Process wide registry of spaCy pipelines.
+
+Pipelines are only loaded (and spaCy only imported) the first time they are asked for, and every caller in the process
+asking for the same pipeline gets the same instance, so DataFrameCreator, Enricher and Eurovoc share one copy of the
+model, and work that never touches spaCy (combining documents, year annotation, tf-idf, label merges) never loads one.
+"""
+
+DEFAULT_MODEL = "en_core_web_sm"
+
+_pipelines = {}
+
+
+def get_nlp(model=DEFAULT_MODEL, sentencizer=False):
+    """Returns the shared pipeline of a model, loading it on first use.
+
+    Args:
+        model (str, optional): name of the spaCy model. Defaults to "en_core_web_sm".
+        sentencizer (bool, optional): with a sentencizer added to the end of the pipeline. Defaults to False.
+
+    Returns:
+        spacy.language.Language: the pipeline
+    """
+    key = (model, sentencizer)
+    if key not in _pipelines:
+        import spacy
+        nlp = spacy.load(model)
+        if sentencizer:
+            nlp.add_pipe('sentencizer')
+        _pipelines[key] = nlp
+    return _pipelines[key]
@@ -3,6 +3,9 @@ from bs4 import BeautifulSoup
 from pdfminer.converter import PDFPageAggregator
 from pdfminer.layout import LAParams, LTTextContainer, LTChar, LTPage, LTTextBox, LTTextLine, LTAnno
 
+# bump whenever CustomRoadMapConverter changes the lines it produces, this invalidates cached layouts
+LAYOUT_VERSION = 1
+
 def is_pdf(anchor):
         """Takes an anchor tag and returns true if the href
         ends with links to a .pdf file. Else returns false.
@@ -18,12 +21,52 @@ def is_pdf(anchor):
         else:
             return False
 
+class TextLine:
+    """A run of text of a single font size on a page. This is the record used for lines and chunks all the way
+    through conversion, it is only turned into its json form ({"size": <size>, "text": <text>, "page": <page>})
+    when written out. Attributes that are None are left out of the json form.
+    """
+    __slots__ = ("size", "text", "page")
+
+    def __init__(self, size=None, text=None, page=None):
+        self.size = size
+        self.text = text
+        self.page = page
+
+    def to_dict(self):
+        d = {}
+        if self.size is not None:
+            d['size'] = self.size
+        if self.text is not None:
+            d['text'] = self.text
+        if self.page is not None:
+            d['page'] = self.page
+        return d
+
+    def __eq__(self, other):
+        return isinstance(other, TextLine) and (self.size, self.text, self.page) == (other.size, other.text, other.page)
+
+    def __repr__(self):
+        return f"TextLine(size={self.size!r}, text={self.text!r}, page={self.page!r})"
+
+
 class CustomRoadMapConverter(PDFPageAggregator):
-    def __init__(self, rsrcmgr, pageno=1, laparams=None):
+    def __init__(self, rsrcmgr, pageno=1, laparams=None, page_number=0):
         PDFPageAggregator.__init__(self, rsrcmgr, pageno=pageno, laparams=laparams)
-        self.rows = []
         self.lines = []
-        self.page_number = 0
+        # zero-based number of the next page to be received, non-zero when laying out a page range
+        self.page_number = page_number
+
+    def pop_lines(self):
+        """Returns the lines laid out since the previous call and releases them from the device, so that
+        callers processing a document page by page only ever hold a single page's lines in memory.
+
+        Returns:
+            list: TextLine records
+        """
+        lines = self.lines
+        self.lines = []
+        return lines
 
     def custom_sort(self, ltpage):
         page_items = []
@@ -43,40 +86,49 @@ class CustomRoadMapConverter(PDFPageAggregator):
         return page_items
     
     def receive_layout(self, ltpage):
+        """Appends the text lines of a laid out page to self.lines. Each LTTextLine is split into runs of characters
+        of the same (rounded) font size, a run ending part way through the line has its whitespace collapsed.
+        """
         # page_items = self.custom_sort(ltpage)
-        def render(item, page_number):
-            if isinstance(item, LTPage) or isinstance(item, LTTextBox):
+        page_number = self.page_number
+        lines = self.lines
+        for item in ltpage:
+            if isinstance(item, LTTextBox):
                 for child in item:
-                    render(child, page_number)
+                    if isinstance(child, LTTextLine):
+                        _split_text_line(child, page_number, lines)
             elif isinstance(item, LTTextLine):
-                line_elements = []
-                curr_element = {}
-                child_str = ''
-                for child in item:
-                    if isinstance(child, LTChar):
-                        if (curr_element == {} or "size" not in curr_element.keys()):
-                            curr_element['size'] = round(child.size)
-                            curr_element['text'] = child.get_text()
-                            curr_element['page'] = page_number
-                        elif curr_element['size'] != round(child.size):
-                            if curr_element['text']:
-                                curr_element['text'] = ' '.join(curr_element['text'].split()).strip()
-                                line_elements.append(curr_element)
-                            curr_element = {"size": round(child.size), "text": child.get_text(), "page": page_number}
-                        else:
-                            curr_element['text'] += child.get_text()
-                    elif isinstance(child, LTAnno):
-                        if (curr_element == {}):
-                            curr_element['text'] = child.get_text()
-                            curr_element['page'] = page_number
-                        else:
-                            curr_element['text'] += child.get_text()
-                line_elements.append(curr_element)
-                self.lines.extend(line_elements)
-                for child in item:
-                    render(child, page_number)
-            return
-        render(ltpage, self.page_number)
+                _split_text_line(item, page_number, lines)
         self.page_number += 1
-        self.rows = sorted(self.rows, key = lambda x: (x[0], -x[2]))
-        self.result = ltpage
\ No newline at end of file
+        self.result = ltpage
+
+
+def _split_text_line(text_line, page_number, lines):
+    """Splits an LTTextLine into TextLine records of a single font size in one pass over its characters, appending
+    them to lines. Text before the first character (only LTAnno spacing) is dropped once a character follows it.
+    """
+    size = None
+    parts = None
+    for child in text_line:
+        if isinstance(child, LTChar):
+            child_size = round(child.size)
+            if size is None:
+                size = child_size
+                parts = [child.get_text()]
+            elif size != child_size:
+                text = ''.join(parts)
+                if text:
+                    lines.append(TextLine(size, ' '.join(text.split()), page_number))
+                size = child_size
+                parts = [child.get_text()]
+            else:
+                parts.append(child.get_text())
+        elif isinstance(child, LTAnno):
+            if parts is None:
+                parts = [child.get_text()]
+            else:
+                parts.append(child.get_text())
+    if parts is None:
+        lines.append(TextLine())
+    else:
+        lines.append(TextLine(size, ''.join(parts), page_number))
@@ -0,0 +1,51 @@
+"""Text normalisation applied to every converted chunk, see RoadmapPDFConverter._preprocess.
+
+The normalisation used to be a chain of substitutions, each one scanning the text and building a new string:
+
+    1. "(cid:<n>)" glyph references -> " "
+    2. a hyphen, newline and following whitespace -> " "
+    3. non-breaking spaces -> " "
+    4. newlines -> " "
+    5. runs of two or more whitespace characters -> " "
+
+followed by a strip. All of these replace something with a single space and everything they replace is, or becomes,
+whitespace, so the chain is equivalent to replacing every run of "whitespace units" (whitespace characters, glyph
+references and hyphen-newline breaks) with a single space. The only run left untouched is a single whitespace character
+that steps 3 and 4 don't replace, such as an ordinary space. TextNormaliser does this in a single scan.
+"""
+
+import re
+
+_CID = r"\(cid:\d+\)"
+_UNIT = rf"(?:\s|{_CID}|-\n(?:\s|{_CID})+)"
+# every run starts with whitespace, "(" or "-". Leading with that character class lets the regex engine skip straight
+# to candidate positions, the lookbehinds then check which kind of unit starts the run. A run of a single whitespace
+# character other than a newline or non-breaking space is left alone.
+_WHITESPACE_RUNS = re.compile(
+    rf"[\s(\-](?:(?<=[\n\xa0])|(?<=\s)(?={_UNIT})|(?<=\()cid:\d+\)|(?<=-)\n(?:\s|{_CID})+){_UNIT}*")
+
+
+class TextNormaliser:
+    def __init__(self, custom_filter=None):
+        """
+        Args:
+            custom_filter (function, optional): applied to the raw text before normalising. Defaults to None.
+        """
+        self.custom_filter = custom_filter
+
+    def normalise(self, text):
+        if self.custom_filter:
+            text = self.custom_filter(text)
+        return _WHITESPACE_RUNS.sub(" ", text).strip()
+
+    def normalise_batch(self, texts):
+        """Normalises a list of texts.
+
+        Returns:
+            list: the normalised texts, in order
+        """
+        sub = _WHITESPACE_RUNS.sub
+        if self.custom_filter:
+            custom_filter = self.custom_filter
+            return [sub(" ", custom_filter(text)).strip() for text in texts]
+        return [sub(" ", text).strip() for text in texts]
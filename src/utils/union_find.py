@@ -0,0 +1,34 @@
+class DisjointSet:
+    """Union-find over the integers 0..n-1, with path halving and union by size.
+    """
+
+    def __init__(self, n):
+        self.parent = list(range(n))
+        self.size = [1] * n
+
+    def find(self, i):
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, i, j):
+        """Merges the sets of i and j.
+
+        Returns:
+            int: the root of the merged set
+        """
+        i, j = self.find(i), self.find(j)
+        if i == j:
+            return i
+        if self.size[i] < self.size[j]:
+            i, j = j, i
+        self.parent[j] = i
+        self.size[i] += self.size[j]
+        return i
+
+    def roots(self):
+        """The root of the set of each element.
+        """
+        return [self.find(i) for i in range(len(self.parent))]
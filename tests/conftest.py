@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the modules in src import each other as top level modules (e.g. "from utils.text import ..."), as when run from src
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_DIR)
@@ -0,0 +1,120 @@
+"""Golden tests of TextNormaliser against the chain of substitutions RoadmapPDFConverter._preprocess used to run.
+"""
+
+import os
+import random
+import re
+
+import pytest
+
+from conftest import SRC_DIR
+from utils.text import TextNormaliser
+
+
+def legacy_preprocess(text, custom_filter=None):
+    """The normalisation of RoadmapPDFConverter._preprocess before utils/text.py, kept as the oracle.
+    """
+    if custom_filter:
+        text = custom_filter(text)
+    new_line = re.sub(r"\(cid:\d+\)", " ", text)
+    new_line = re.sub(r"\-\n\s+", " ", new_line)
+    new_line = re.sub(r"\xa0", " ", new_line)
+    new_line = re.sub(r"\n{1}", " ", new_line)
+    new_line = re.sub(r"\s\s+", " ", new_line)
+    return new_line.strip()
+
+
+def legacy_ieo_filter(line):
+    return "" if re.match(r"^(Table|Figure) [A-Z]?(\d+|\d+\-\d+)\.", line) else line
+
+
+def legacy_aeo_filter(line):
+    return "" if re.match(r"^(Table|Figure) ([A-Z]+)?([\d\-]+)\.", line) else line
+
+
+FIXED = [
+    "",
+    " ",
+    "\n",
+    "\xa0",
+    "plain text",
+    "effici-\nency",
+    "effici-\n  ency",
+    "effici-\n(cid:3)ency",
+    "effici-\nency-\n",
+    "a-\n",
+    "a -\n b",
+    "a\tb",
+    "a \tb",
+    "a\xa0b",
+    "a\xa0\xa0b",
+    "a\nb",
+    "a\n\nb",
+    "a(cid:12)b",
+    "a (cid:12) b",
+    "(cid:1)(cid:2)",
+    "(cid:)a",
+    "(cid:1",
+    "cid:1)",
+    "\t lead and trail \n",
+    "a\r\nb",
+    "a\x0cb",
+    "a b",
+    "a - b",
+    "a--\nb",
+    "line one\nline two\xa0\n- three",
+    "Table 3. World energy consumption",
+    "Figure A12. Crude oil prices",
+    "Figure 2-3. Electricity",
+    "Table AB1-2. Generation",
+    "Tables 3. not a header",
+    "see Table 3. in the text",
+    "Figure\n3. split header",
+]
+
+FRAGMENTS = [" ", "  ", "\n", "\n\n", "\t", "\xa0", "\r", "-", "-\n", "-\n ", "(cid:7)", "(cid:", ")", "(", "cid:1)",
+             "a", "bc", "Table ", "Figure ", "A", "3", "12", "-4", ".", "x"]
+
+
+def fuzzed(n=5000, seed=0):
+    rng = random.Random(seed)
+    return ["".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(0, 12))) for _ in range(n)]
+
+
+@pytest.fixture(scope="module")
+def converters():
+    """The IEO and AEO converters, built from their configs, with the cwd the converter expects.
+    """
+    cwd = os.getcwd()
+    os.chdir(SRC_DIR)
+    try:
+        from converter import EIAIEOConverter, EIAAEOConverter
+        yield {"ieo": EIAIEOConverter(), "aeo": EIAAEOConverter()}
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.mark.parametrize("text", FIXED)
+def test_normalise_fixed(text):
+    assert TextNormaliser().normalise(text) == legacy_preprocess(text)
+
+
+def test_normalise_fuzzed():
+    normaliser = TextNormaliser()
+    for text in fuzzed():
+        assert normaliser.normalise(text) == legacy_preprocess(text), repr(text)
+
+
+def test_normalise_batch():
+    texts = FIXED + fuzzed(1000, seed=1)
+    assert TextNormaliser().normalise_batch(texts) == [legacy_preprocess(text) for text in texts]
+
+
+@pytest.mark.parametrize("name, legacy_filter", [("ieo", legacy_ieo_filter), ("aeo", legacy_aeo_filter)])
+def test_custom_filter(converters, name, legacy_filter):
+    normaliser = converters[name].normaliser
+    assert normaliser.custom_filter is not None
+    texts = FIXED + fuzzed(3000, seed=2)
+    expected = [legacy_preprocess(text, legacy_filter) for text in texts]
+    assert [normaliser.normalise(text) for text in texts] == expected
+    assert normaliser.normalise_batch(texts) == expected